@@ -0,0 +1,23 @@
+import pytest
+
+from tf_idf.benchmark import zipf_corpus, zipf_queries
+from tf_idf.ingest import build_index
+
+VOCABULARY_SIZE = 3000
+
+
+@pytest.fixture(scope="session")
+def zipf_documents():
+    """A seeded Zipf corpus of 3000 ``(doc_id, text)`` pairs."""
+    return list(zipf_corpus(3000, vocabulary_size=VOCABULARY_SIZE, mean_length=40, seed=7))
+
+
+@pytest.fixture(scope="session")
+def zipf_index(zipf_documents):
+    return build_index(zipf_documents)
+
+
+@pytest.fixture(scope="session")
+def queries():
+    """300 term-count queries of 1 to 6 terms over the corpus vocabulary."""
+    return zipf_queries(300, vocabulary_size=VOCABULARY_SIZE, max_terms=6, seed=8)
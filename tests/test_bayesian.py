@@ -0,0 +1,44 @@
+import math
+
+import numpy as np
+
+from tf_idf.bayesian import CASES, _round_like_python, bayesian_weights
+
+
+def calculate_w(r_rel, R, n_doc, N, case):
+    """The scalar weights of the original notebook."""
+    if case == 1:
+        numerator = ((r_rel + 0.5) / (R + 1))
+        denominator = ((n_doc + 1) / (N + 2))
+    elif case == 2:
+        numerator = ((r_rel + 0.5) / (R + 1))
+        denominator = ((n_doc - r_rel + 0.5) / (N - R + 1))
+    elif case == 3:
+        numerator = ((r_rel + 0.5) / (R - r_rel + 0.5))
+        denominator = ((n_doc + 1) / (N - n_doc + 1))
+    else:
+        numerator = ((r_rel + 0.5) / (R - r_rel + 0.5))
+        denominator = ((n_doc - r_rel + 0.5) / ((N - n_doc) - (R - r_rel) + 0.5))
+    return round(math.log10(numerator / denominator), 3)
+
+
+def test_weights_match_the_scalar_formulas():
+    # Every consistent (r, R, n, N) with N < 40: r relevant documents contain
+    # the term, n - r other ones do, and the rest is split accordingly.
+    statistics = np.array([(r, R, n, N)
+                           for N in range(1, 40)
+                           for n in range(N + 1)
+                           for R in range(N + 1)
+                           for r in range(max(0, n + R - N), min(n, R) + 1)])
+    weights = bayesian_weights(*statistics.T)
+    for case, name in enumerate(CASES, 1):
+        expected = [calculate_w(*row, case) for row in statistics.tolist()]
+        assert weights[name].tolist() == expected
+
+
+def test_halfway_values_round_like_python():
+    # np.round(0.0025, 3) is 0.002, the built-in round() gives 0.003.
+    quotient = 10 ** 0.0025
+    rounded = _round_like_python(np.array([0.0025]), np.array([quotient]), 3)
+    assert np.round(0.0025, 3) != round(0.0025, 3)
+    assert rounded.tolist() == [round(math.log10(quotient), 3)]
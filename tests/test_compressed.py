@@ -0,0 +1,13 @@
+import pytest
+
+from tf_idf.compressed import CompressedIndex
+
+
+@pytest.mark.parametrize("weights", ["uint8", "float32"])
+@pytest.mark.parametrize("k", [1, 5, 10, 100])
+def test_block_max_search_matches_exhaustive(zipf_index, queries, weights, k):
+    compressed = CompressedIndex(zipf_index, block_size=32, weights=weights)
+    for query in queries:
+        query_weights = compressed.weigh_query(query)
+        assert (compressed.search(query_weights, k)
+                == compressed.search(query_weights, k, exhaustive=True))
@@ -0,0 +1,15 @@
+import pytest
+
+
+@pytest.mark.parametrize("k", [1, 5, 10, 100])
+def test_max_score_matches_exhaustive(zipf_index, queries, k):
+    for query in queries:
+        weights = zipf_index.weigh_query(query)
+        assert zipf_index.search(weights, k) == zipf_index.search(weights, k, exhaustive=True)
+
+
+@pytest.mark.parametrize("k", [1, 10, 100])
+def test_search_batch_matches_search(zipf_index, queries, k):
+    expected = [zipf_index.search(zipf_index.weigh_query(query), k) for query in queries]
+    assert zipf_index.search_batch(queries, k) == expected
+    assert zipf_index.search_batch(queries, k, max_products=5000) == expected
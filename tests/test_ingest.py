@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+from tf_idf.ingest import build_index
+
+ARRAYS = ("term_ptr", "doc_rows", "weights", "idf")
+
+
+def _vocabulary_order(index):
+    return sorted(index.vocabulary.items(), key=lambda item: item[1])
+
+
+@pytest.mark.parametrize("options", [
+    {"workers": 3, "chunk_size": 400},
+    {"memory_budget": 100_000},
+    {"workers": 2, "chunk_size": 700, "memory_budget": 100_000},
+    {"output": True},
+], ids=["parallel", "spilling", "parallel-spilling", "on-disk"])
+def test_builds_are_byte_identical(zipf_documents, zipf_index, tmp_path, options):
+    if options.get("output"):
+        options = {**options, "output": tmp_path / "index"}
+    index = build_index(iter(zipf_documents), **options)
+    for name in ARRAYS:
+        assert np.asarray(getattr(index, name)).tobytes() == getattr(zipf_index, name).tobytes()
+    assert _vocabulary_order(index) == _vocabulary_order(zipf_index)
+    assert list(index.doc_ids) == list(zipf_index.doc_ids)
@@ -0,0 +1,8 @@
+from tf_idf.positions import PositionalIndex
+
+
+def test_phrase_does_not_match_across_dropped_words():
+    positions = PositionalIndex([(0, "shipment of gold arrived in a truck")])
+    assert positions.phrase("in truck") == []
+    assert positions.phrase("in a truck") == [(0, 1)]
+    assert positions.near("in truck", 2) == [(0, 1)]
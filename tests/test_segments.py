@@ -0,0 +1,81 @@
+import threading
+
+import numpy as np
+import pytest
+
+import tf_idf.segments
+from tf_idf.ingest import build_index
+from tf_idf.segments import SegmentedIndex
+
+
+def _assert_same_results(segmented, live, queries, k=10):
+    """Results of ``segmented`` match a fresh build of the ``live`` documents."""
+    assert len(segmented) == len(live)
+    index = build_index(live.items())
+    for query in queries:
+        expected = index.search(index.weigh_query(query), k)
+        results = segmented.search(segmented.weigh_query(query), k)
+        # Equal scores may be tied in either order, so compare the scores in
+        # rank order and each document's score separately.
+        assert [score for _, score in results] == pytest.approx(
+            [score for _, score in expected])
+        all_scores = dict(index.search(index.weigh_query(query), len(live)))
+        for doc_id, score in results:
+            assert score == pytest.approx(all_scores[doc_id])
+
+
+@pytest.mark.parametrize("background_merge", [False, True], ids=["foreground", "background"])
+def test_add_update_delete_match_fresh_build(zipf_documents, queries, background_merge):
+    rng = np.random.default_rng(3)
+    documents = zipf_documents[:1500]
+    segmented = SegmentedIndex(buffer_size=40, merge_factor=3,
+                               background_merge=background_merge)
+    live = {}
+    for start in range(0, len(documents), 25):
+        chunk = documents[start:start + 25]
+        segmented.add_documents(chunk)
+        live.update(chunk)
+        for doc_id in rng.choice(list(live), 3, replace=False).tolist():
+            segmented.delete_document(doc_id)
+            del live[doc_id]
+        for doc_id in rng.choice(list(live), 3, replace=False).tolist():
+            text = documents[int(rng.integers(len(documents)))][1]
+            segmented.update_document(doc_id, text)
+            live[doc_id] = text
+    segmented.wait_for_merges()
+    assert len(segmented.segments) < 2 * segmented.merge_factor
+    _assert_same_results(segmented, live, queries[:100])
+
+
+def test_deletes_during_a_background_merge_keep_their_tombstones(
+        zipf_documents, queries, monkeypatch):
+    merging = threading.Event()
+    release = threading.Event()
+    merge_segments = tf_idf.segments.merge_segments
+
+    def blocking_merge(segments):
+        merged = merge_segments(segments)
+        if not merging.is_set():
+            merging.set()
+            release.wait(10)
+        return merged
+
+    monkeypatch.setattr(tf_idf.segments, "merge_segments", blocking_merge)
+    documents = zipf_documents[:20]
+    segmented = SegmentedIndex(buffer_size=10, merge_factor=2)
+    segmented.add_documents(documents[:10])
+    segmented.add_documents(documents[10:])
+    assert merging.wait(10)
+
+    live = dict(documents)
+    segmented.delete_document(3)
+    del live[3]
+    segmented.update_document(15, documents[0][1])
+    live[15] = documents[0][1]
+    release.set()
+    segmented.wait_for_merges()
+
+    [merged] = segmented.segments
+    assert len(merged) == 20 and merged.live_count == 18
+    assert 3 not in segmented and 15 in segmented
+    _assert_same_results(segmented, live, queries[:100])
@@ -0,0 +1,78 @@
+import asyncio
+import json
+import socket
+
+from tf_idf.analysis import term_frequencies
+from tf_idf.bayesian import FeedbackSession
+from tf_idf.server import QueryServer, query
+
+
+def _text(term_counts):
+    return " ".join(term for term, count in term_counts.items() for _ in range(count))
+
+
+def _serve(index, exchange, **options):
+    """Run ``exchange(port)`` in a thread against a server on a free port."""
+    async def run():
+        async with QueryServer(index, port=0, **options) as server:
+            return server, await asyncio.to_thread(exchange, server.port)
+
+    return asyncio.run(run())
+
+
+def _send_raw(port, payload):
+    with socket.create_connection(("127.0.0.1", port), timeout=30) as connection:
+        connection.sendall(payload)
+        connection.shutdown(socket.SHUT_WR)
+        with connection.makefile("rb") as responses:
+            return [json.loads(line) for line in responses]
+
+
+def test_inner_results_match_search(zipf_index, queries):
+    requests = [{"query": _text(q), "k": 10, "id": i} for i, q in enumerate(queries[:50])]
+    _, responses = _serve(zipf_index, lambda port: query(requests, port))
+    for request, response in zip(requests, responses):
+        weights = zipf_index.weigh_query(term_frequencies(request["query"]))
+        assert response["id"] == request["id"]
+        assert response["results"] == [list(hit) for hit in zipf_index.search(weights, 10)]
+
+
+def test_bayesian_results_match_feedback_session(zipf_index, queries):
+    relevant = [zipf_index.doc_ids[row] for row in (3, 14, 159)]
+    requests = [{"query": _text(q), "model": "bayesian", "relevant": relevant, "k": 20}
+                for q in queries[:20]]
+    _, responses = _serve(zipf_index, lambda port: query(requests, port))
+    for request, response in zip(requests, responses):
+        session = FeedbackSession(zipf_index, term_frequencies(request["query"]))
+        session.judge(relevant)
+        assert response["results"] == [list(hit) for hit in session.rank(20)]
+
+
+def test_errors_stay_with_their_request_in_a_batch(zipf_index, queries):
+    bayesian = {"query": _text(queries[1]), "model": "bayesian"}
+    requests = [
+        {"query": _text(queries[0]), "id": "inner"},
+        {**bayesian, "relevant": ["missing"], "id": "unknown"},
+        {**bayesian, "relevant": [["a"]], "id": "unhashable"},
+        {**bayesian, "relevant": [zipf_index.doc_ids[0]], "id": "bayesian"},
+    ]
+    server, responses = _serve(zipf_index, lambda port: query(requests, port),
+                               batch_window=0.5)
+    assert server.batches == 1 and server.requests == len(requests)
+    by_id = {response["id"]: response for response in responses}
+    assert "KeyError" in by_id["unknown"]["error"]
+    assert "TypeError" in by_id["unhashable"]["error"]
+    assert by_id["inner"]["results"] and by_id["bayesian"]["results"]
+
+
+def test_malformed_requests_get_errors(zipf_index):
+    payload = (b"not json\n"
+               b"[1, 2]\n"
+               b'{"query": "t1", "k": true}\n'
+               b'{"query": "' + b"t1 " * 30000 + b'"}\n'
+               b'{"query": "t1", "id": 7}')
+    _, responses = _serve(zipf_index, lambda port: _send_raw(port, payload),
+                          max_request_bytes=1 << 16)
+    assert [set(response) for response in responses[:4]] == [{"error"}] * 4
+    assert "65536 bytes" in responses[3]["error"]
+    assert responses[4]["id"] == 7 and responses[4]["results"]
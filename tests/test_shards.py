@@ -0,0 +1,25 @@
+import pytest
+
+from tf_idf.shards import ShardedIndex, build_shards
+
+
+@pytest.fixture(scope="module")
+def sharded(zipf_documents, tmp_path_factory):
+    path = tmp_path_factory.mktemp("shards")
+    build_shards(zipf_documents, path, n_shards=3)
+    with ShardedIndex(path) as index:
+        yield index
+
+
+@pytest.mark.parametrize("k", [1, 10, 100])
+def test_search_matches_single_index(sharded, zipf_index, queries, k):
+    for query in queries:
+        expected = zipf_index.search(zipf_index.weigh_query(query), k)
+        assert sharded.weigh_query(query) == zipf_index.weigh_query(query)
+        assert sharded.search(sharded.weigh_query(query), k) == expected
+
+
+@pytest.mark.parametrize("k", [1, 10, 100])
+def test_search_batch_matches_single_index(sharded, zipf_index, queries, k):
+    expected = [zipf_index.search(zipf_index.weigh_query(query), k) for query in queries]
+    assert sharded.search_batch(queries, k) == expected
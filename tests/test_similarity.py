@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from tf_idf.ingest import build_index
+from tf_idf.similarity import all_pairs
+
+
+@pytest.fixture(scope="module")
+def near_duplicates(zipf_documents):
+    """300 documents plus 100 copies of some of them with up to 90% of the words dropped."""
+    rng = np.random.default_rng(11)
+    documents = list(zipf_documents[:300])
+    for i, (_, text) in enumerate(documents[:100]):
+        words = text.split()
+        keep = rng.random(len(words)) >= rng.uniform(0, 0.9)
+        documents.append((f"copy-{i}", " ".join(w for w, k in zip(words, keep) if k) or text))
+    return build_index(documents)
+
+
+def _brute_force(index, normalize):
+    """Every pair's score from the dense document-term matrix, upper triangle."""
+    matrix = np.zeros((index.n_documents, len(index.idf)))
+    term_ids = np.repeat(np.arange(len(index.idf)), np.diff(index.term_ptr))
+    matrix[index.doc_rows, term_ids] = index.weights
+    if normalize:
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.triu(matrix @ matrix.T, 1)
+
+
+def _assert_matches(index, pairs, scores, threshold):
+    found = {(a, b): score for a, b, score in pairs}
+    position = {doc_id: row for row, doc_id in enumerate(index.doc_ids)}
+    for (a, b), score in found.items():
+        assert position[a] < position[b]
+        assert score == pytest.approx(scores[position[a], position[b]])
+    # Pairs within rounding of the threshold may go either way.
+    rows_a, rows_b = np.nonzero(scores >= threshold + 1e-9)
+    expected = {(index.doc_ids[a], index.doc_ids[b]) for a, b in zip(rows_a, rows_b)}
+    assert expected <= found.keys()
+    assert all(score >= threshold - 1e-9 for score in found.values())
+    assert expected
+
+
+@pytest.mark.parametrize("threshold", [0.3, 0.6, 0.9])
+def test_cosine_matches_brute_force(near_duplicates, threshold):
+    pairs = list(all_pairs(near_duplicates, threshold, memory_budget=1 << 16))
+    _assert_matches(near_duplicates, pairs, _brute_force(near_duplicates, True), threshold)
+
+
+def test_inner_product_matches_brute_force(near_duplicates):
+    scores = _brute_force(near_duplicates, False)
+    threshold = float(np.quantile(scores[scores > 0], 0.99))
+    pairs = list(all_pairs(near_duplicates, threshold, normalize=False))
+    _assert_matches(near_duplicates, pairs, scores, threshold)
+
+
+def test_workers_match_serial(near_duplicates):
+    serial = list(all_pairs(near_duplicates, 0.6))
+    assert list(all_pairs(near_duplicates, 0.6, workers=3)) == serial
+    _assert_matches(near_duplicates, serial, _brute_force(near_duplicates, True), 0.6)
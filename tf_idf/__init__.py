@@ -0,0 +1,50 @@
+"""Building blocks for TF-IDF text analysis and information retrieval.
+
+Importing the package does no work: the names below are loaded from their
+modules on first access, so ``import tf_idf`` or a worker process that only
+needs :mod:`tf_idf.index` does not pay for the rest of the package.
+"""
+
+import importlib
+
+_EXPORTS = {
+    "Analyzer": "tf_idf.analysis",
+    "CachedSearcher": "tf_idf.cache",
+    "CompressedIndex": "tf_idf.compressed",
+    "FeedbackSession": "tf_idf.bayesian",
+    "IndexBuilder": "tf_idf.ingest",
+    "IndexStatistics": "tf_idf.statistics",
+    "InvertedIndex": "tf_idf.index",
+    "LRUCache": "tf_idf.cache",
+    "PositionalIndex": "tf_idf.positions",
+    "Segment": "tf_idf.segments",
+    "SegmentedIndex": "tf_idf.segments",
+    "ShardedIndex": "tf_idf.shards",
+    "TermMatrix": "tf_idf.matrix",
+    "all_pairs": "tf_idf.similarity",
+    "bayesian_weights": "tf_idf.bayesian",
+    "build_index": "tf_idf.ingest",
+    "build_shards": "tf_idf.shards",
+    "build_term_matrix": "tf_idf.matrix",
+    "load_index": "tf_idf.storage",
+    "read_documents": "tf_idf.ingest",
+    "relevance_statistics": "tf_idf.bayesian",
+    "save_index": "tf_idf.storage",
+    "term_frequencies": "tf_idf.analysis",
+    "tokenize": "tf_idf.analysis",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
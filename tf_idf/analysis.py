@@ -0,0 +1,65 @@
+"""Tokenization and vocabulary/document-frequency building.
+
+Tokens follow the scikit-learn ``TfidfVectorizer`` defaults: the text is
+lowercased and tokens are runs of two or more word characters.
+"""
+
+import re
+from collections import Counter
+
+from tf_idf.instrumentation import instrumentation
+from tf_idf.statistics import IndexStatistics
+
+TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def term_frequencies(text):
+    if not instrumentation.enabled:
+        return Counter(tokenize(text))
+    with instrumentation.stage("tokenize"):
+        return Counter(tokenize(text))
+
+
+class Analyzer:
+    """Streaming analyzer that tokenizes every document exactly once.
+
+    Each call to :meth:`analyze` returns the document's term counts and
+    updates the shared :class:`~tf_idf.statistics.IndexStatistics`: the
+    vocabulary (term -> id, in first-seen order), the exact document
+    frequencies and the number of documents.
+    """
+
+    def __init__(self, statistics=None):
+        self.statistics = IndexStatistics() if statistics is None else statistics
+
+    @property
+    def vocabulary(self):
+        return self.statistics.vocabulary
+
+    @property
+    def n_documents(self):
+        return self.statistics.n_documents
+
+    @property
+    def document_frequency(self):
+        return dict(zip(self.statistics.vocabulary, self.statistics.df.tolist()))
+
+    def analyze(self, text):
+        counts = term_frequencies(text)
+        self.statistics.add_document(counts)
+        instrumentation.count("documents_tokenized")
+        return counts
+
+    def analyze_all(self, documents):
+        """Analyze a ``{doc_id: text}`` mapping or any iterable of pairs."""
+        if hasattr(documents, "items"):
+            documents = documents.items()
+        return {doc_id: self.analyze(text) for doc_id, text in documents}
+
+    def sorted_vocabulary(self):
+        """Alphabetical term -> id mapping, the column order used by scikit-learn."""
+        return {term: i for i, term in enumerate(sorted(self.vocabulary))}
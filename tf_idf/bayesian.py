@@ -0,0 +1,200 @@
+"""Bayesian probabilistic retrieval weights.
+
+For a term, ``r`` is the number of relevant documents containing it, ``R``
+the number of relevant documents, ``n`` the number of documents containing
+it and ``N`` the number of documents. The four weighting schemes are::
+
+    w1 = log10(((r + 0.5) / (R + 1)) / ((n + 1) / (N + 2)))
+    w2 = log10(((r + 0.5) / (R + 1)) / ((n - r + 0.5) / (N - R + 1)))
+    w3 = log10(((r + 0.5) / (R - r + 0.5)) / ((n + 1) / (N - n + 1)))
+    w4 = log10(((r + 0.5) / (R - r + 0.5)) / ((n - r + 0.5) / ((N - n) - (R - r) + 0.5)))
+"""
+
+import math
+
+import numpy as np
+
+from tf_idf.index import _top_k
+from tf_idf.instrumentation import instrumentation
+
+CASES = ("w1", "w2", "w3", "w4")
+
+
+def _ratios(r_rel, R, n_doc, N):
+    relevant = (r_rel + 0.5) / (R + 1)
+    relevant_odds = (r_rel + 0.5) / (R - r_rel + 0.5)
+    return {
+        "w1": (relevant, (n_doc + 1) / (N + 2)),
+        "w2": (relevant, (n_doc - r_rel + 0.5) / (N - R + 1)),
+        "w3": (relevant_odds, (n_doc + 1) / (N - n_doc + 1)),
+        "w4": (relevant_odds, (n_doc - r_rel + 0.5) / ((N - n_doc) - (R - r_rel) + 0.5)),
+    }
+
+
+def bayesian_weights(r_rel, R, n_doc, N, decimals=3):
+    """Compute w1-w4 for arrays of term statistics in one call.
+
+    The arguments broadcast against each other, so a batch of relevance
+    judgments is passed as ``r_rel`` of shape ``(queries, terms)`` with ``R``
+    of shape ``(queries, 1)``. Returns ``{"w1": ..., "w4": ...}`` arrays of
+    the broadcast shape, rounded like ``round(w, decimals)`` (no rounding
+    when ``decimals`` is None). Undefined weights, e.g. a logarithm of a
+    negative ratio when ``r > n``, are NaN.
+    """
+    r_rel, R, n_doc, N = (np.asarray(x, dtype=np.float64) for x in (r_rel, R, n_doc, N))
+    weights = {}
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for case, (numerator, denominator) in _ratios(r_rel, R, n_doc, N).items():
+            quotient = np.broadcast_to(numerator / denominator, np.broadcast_shapes(
+                r_rel.shape, R.shape, n_doc.shape, N.shape))
+            w = np.log10(quotient)
+            if decimals is not None:
+                w = _round_like_python(w, quotient, decimals)
+            weights[case] = w
+    return weights
+
+
+def _round_like_python(values, quotients, decimals):
+    # np.round scales by 10**decimals and can differ from the correctly
+    # rounded built-in round() at the halfway points; those few values are
+    # recomputed with the scalar functions.
+    rounded = np.round(values, decimals)
+    scaled = values * 10.0 ** decimals
+    close = np.isfinite(values) & (np.abs(np.abs(scaled - np.floor(scaled)) - 0.5) < 1e-6)
+    for position in zip(*np.nonzero(close)):
+        rounded[position] = round(math.log10(quotients[position]), decimals)
+    return rounded
+
+
+def relevance_statistics(index, terms, relevant_doc_ids):
+    """``n``, ``N``, ``r`` and ``R`` for ``terms`` read from an index.
+
+    ``index`` is an :class:`~tf_idf.index.InvertedIndex` or a
+    :class:`~tf_idf.segments.SegmentedIndex`. ``n`` is the postings length
+    (document frequency) of each term and ``r`` the number of documents in
+    ``relevant_doc_ids``, a collection of document ids of any size, that
+    contain it.
+    """
+    relevant_doc_ids = list(dict.fromkeys(relevant_doc_ids))
+    return {
+        "n": np.array([index.document_frequency(term) for term in terms], dtype=np.int64),
+        "N": index.n_documents,
+        "r": index.count_relevant(terms, relevant_doc_ids),
+        "R": len(relevant_doc_ids),
+    }
+
+
+class FeedbackSession:
+    """Rank documents by Bayesian term weights and refine them with judgments.
+
+    Documents are scored by summing the ``weight`` scheme ("w1" to "w4") of
+    the query terms they contain, so a document's score depends only on
+    which query terms it contains. ``n`` and ``N`` are read once, and the
+    matching documents are grouped once by that set of terms (at most
+    ``2**len(terms)`` groups). Each :meth:`judge` call then only intersects
+    the newly judged documents with the postings to update ``r`` and ``R``,
+    and :meth:`rank` scores the groups and takes the top ``k`` from the best
+    of them, so a round costs nothing per posting. ``index`` is an
+    :class:`~tf_idf.index.InvertedIndex`.
+    """
+
+    def __init__(self, index, query_terms, weight="w4"):
+        if weight not in CASES:
+            raise ValueError(f"weight must be one of {CASES}, got {weight!r}")
+        self.index = index
+        self.weight = weight
+        self.terms = [term for term in dict.fromkeys(query_terms) if term in index.vocabulary]
+        self.n = np.array([index.document_frequency(term) for term in self.terms],
+                          dtype=np.int64)
+        self.N = index.n_documents
+        self.r = np.zeros(len(self.terms), dtype=np.int64)
+        self.relevant = set()
+        self.non_relevant = set()
+
+        rows = [index.postings(term)[0] for term in self.terms]
+        lengths = [len(term_rows) for term_rows in rows]
+        term_of_posting = np.repeat(np.arange(len(self.terms)), lengths)
+        matched, accumulator = np.unique(
+            np.concatenate(rows) if rows else np.empty(0, dtype=np.int32),
+            return_inverse=True)
+
+        # The signature of a document has bit t % 63 of word t // 63 set when
+        # it contains term t. Documents with equal signatures form a group,
+        # whose rows are kept in ascending order.
+        signatures = np.zeros((len(matched), max((len(self.terms) + 62) // 63, 1)),
+                              dtype=np.int64)
+        np.add.at(signatures, (accumulator, term_of_posting // 63),
+                  np.left_shift(np.int64(1), term_of_posting % 63))
+        if signatures.shape[1] == 1:
+            group_signatures, group_of_row = np.unique(signatures[:, 0], return_inverse=True)
+            group_signatures = group_signatures[:, None]
+        else:
+            group_signatures, group_of_row = np.unique(signatures, axis=0, return_inverse=True)
+        group_of_row = group_of_row.reshape(-1)
+        term_ids = np.arange(len(self.terms))
+        self._members = (group_signatures[:, term_ids // 63] >> (term_ids % 63)) & 1 == 1
+        self._group_rows = matched[np.argsort(group_of_row, kind="stable")]
+        self._group_ptr = np.zeros(len(group_signatures) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(group_of_row, minlength=len(group_signatures)),
+                  out=self._group_ptr[1:])
+
+    @property
+    def R(self):
+        return len(self.relevant)
+
+    def judge(self, relevant=(), non_relevant=()):
+        """Record relevance judgments; a later judgment overrides an earlier one."""
+        relevant = [doc_id for doc_id in dict.fromkeys(relevant) if doc_id not in self.relevant]
+        retracted = [doc_id for doc_id in dict.fromkeys(non_relevant)
+                     if doc_id in self.relevant]
+        if relevant:
+            self.r += self.index.count_relevant(self.terms, relevant)
+            self.relevant.update(relevant)
+            self.non_relevant.difference_update(relevant)
+        if retracted:
+            self.r -= self.index.count_relevant(self.terms, retracted)
+            self.relevant.difference_update(retracted)
+        self.non_relevant.update(non_relevant)
+
+    def term_weights(self):
+        """Current unrounded weight of every query term."""
+        return bayesian_weights(self.r, self.R, self.n, self.N, decimals=None)[self.weight]
+
+    def rank(self, k=10, exclude_judged=False):
+        """Top-``k`` documents containing a query term, as ``[(doc_id, score), ...]``."""
+        if k <= 0 or not len(self._group_rows):
+            return []
+        with instrumentation.stage("weighting"):
+            weights = self.term_weights()
+        with instrumentation.stage("postings"):
+            # Added in query order, like an accumulator over the postings.
+            scores = np.zeros(len(self._members), dtype=np.float64)
+            for term, weight in enumerate(weights):
+                scores = scores + np.where(self._members[:, term], weight, 0.0)
+        instrumentation.count("accumulators_touched", len(scores))
+
+        judged = None
+        if exclude_judged and (self.relevant or self.non_relevant):
+            judged = self.index.rows_of(self.relevant | self.non_relevant)
+        limit = k + (0 if judged is None else len(judged))
+        with instrumentation.stage("top_k"):
+            # Ties are broken by row, and rows are ascending within a group,
+            # so only the first rows of the best groups can make the top k.
+            candidate_rows = []
+            candidate_scores = []
+            found = 0
+            for group in np.argsort(-scores, kind="stable").tolist():
+                if found >= k and scores[group] != candidate_scores[-1][0]:
+                    break
+                start = self._group_ptr[group]
+                rows = self._group_rows[start:min(start + limit, self._group_ptr[group + 1])]
+                if judged is not None:
+                    rows = rows[~np.isin(rows, judged, assume_unique=True)]
+                if len(rows):
+                    candidate_rows.append(rows)
+                    candidate_scores.append(np.full(len(rows), scores[group]))
+                    found += len(rows)
+            if not candidate_rows:
+                return []
+            top = _top_k(np.concatenate(candidate_rows), np.concatenate(candidate_scores), k)
+        return [(self.index.doc_ids[row], score) for row, score in top]
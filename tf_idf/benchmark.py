@@ -0,0 +1,199 @@
+"""Benchmarks on reproducible synthetic Zipfian corpora.
+
+Run from the repository root::
+
+    python -m tf_idf.benchmark --sizes 1000,10000,100000 --output bench.json
+    python -m tf_idf.benchmark --sizes 1000,10000 --compare bench.json
+
+For every corpus size this measures index build throughput and peak memory,
+single-query latency (p50/p99), batch query throughput of the inner-product
+scorer and Bayesian weight throughput. With ``--compare`` every metric is
+checked against an earlier JSON report, and a metric that is worse by more
+than ``--tolerance`` is reported as a regression (exit status 1).
+
+Each size runs in a fresh process, so its peak memory is not the peak of
+an earlier, smaller or larger, size.
+"""
+
+import argparse
+import json
+import multiprocessing
+import platform
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from tf_idf.bayesian import bayesian_weights
+from tf_idf.ingest import build_index
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# Metric name -> True when larger is better.
+METRICS = {
+    "build_docs_per_second": True,
+    "peak_rss_mb": False,
+    "query_p50_ms": False,
+    "query_p99_ms": False,
+    "batch_queries_per_second": True,
+    "bayesian_weights_per_second": True,
+}
+
+
+def _zipf_sampler(vocabulary_size, exponent, rng):
+    cumulative = np.cumsum(1.0 / np.arange(1, vocabulary_size + 1) ** exponent)
+    cumulative /= cumulative[-1]
+    return lambda size: np.searchsorted(cumulative, rng.random(size))
+
+
+def zipf_corpus(n_documents, vocabulary_size=50000, mean_length=100, exponent=1.1, seed=0):
+    """Yield ``(doc_id, text)`` pairs whose term ranks follow a Zipf law."""
+    rng = np.random.default_rng(seed)
+    sample = _zipf_sampler(vocabulary_size, exponent, rng)
+    for doc_id in range(n_documents):
+        length = max(int(rng.poisson(mean_length)), 1)
+        yield doc_id, " ".join(f"t{rank}" for rank in sample(length).tolist())
+
+
+def zipf_queries(n_queries, vocabulary_size=50000, max_terms=4, exponent=1.1, seed=1):
+    """Term-count queries of 1 to ``max_terms`` Zipf-distributed terms."""
+    rng = np.random.default_rng(seed)
+    sample = _zipf_sampler(vocabulary_size, exponent, rng)
+    queries = []
+    for _ in range(n_queries):
+        ranks = sample(int(rng.integers(1, max_terms + 1))).tolist()
+        query = {}
+        for rank in ranks:
+            query[f"t{rank}"] = query.get(f"t{rank}", 0) + 1
+        queries.append(query)
+    return queries
+
+
+def peak_rss_mb():
+    """Peak RSS of this process plus that of its largest finished child.
+
+    ``ru_maxrss`` covers the whole life of the process, so a fresh process
+    is needed per measurement. Children, e.g. the workers of a parallel
+    build, are counted once they have exited.
+    """
+    if resource is None:
+        return None
+    peak = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            + resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+
+
+def run_size(n_documents, n_queries=1000, k=10, vocabulary_size=50000, mean_length=100,
+             workers=1, seed=0):
+    result = {"n_documents": n_documents}
+
+    start = time.perf_counter()
+    index = build_index(zipf_corpus(n_documents, vocabulary_size, mean_length, seed=seed),
+                        workers=workers)
+    build_seconds = time.perf_counter() - start
+    result["build_seconds"] = build_seconds
+    result["build_docs_per_second"] = n_documents / build_seconds
+    result["n_postings"] = int(index.term_ptr[-1])
+    result["peak_rss_mb"] = peak_rss_mb()
+
+    queries = zipf_queries(n_queries, vocabulary_size, seed=seed + 1)
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        index.search(index.weigh_query(query), k)
+        latencies.append(time.perf_counter() - start)
+    result["query_p50_ms"] = float(np.percentile(latencies, 50) * 1000)
+    result["query_p99_ms"] = float(np.percentile(latencies, 99) * 1000)
+
+    start = time.perf_counter()
+    index.search_batch(queries, k)
+    result["batch_queries_per_second"] = n_queries / (time.perf_counter() - start)
+
+    # One relevance-judgment set per query over 64 terms.
+    rng = np.random.default_rng(seed + 2)
+    N = n_documents
+    n = rng.integers(1, N + 1, size=(n_queries, 64))
+    R = rng.integers(1, 101, size=(n_queries, 1))
+    r = np.minimum(rng.integers(0, 101, size=(n_queries, 64)), np.minimum(n, R))
+    start = time.perf_counter()
+    bayesian_weights(r, R, n, N)
+    result["bayesian_weights_per_second"] = 4 * r.size / (time.perf_counter() - start)
+    return result
+
+
+def compare(report, baseline, tolerance):
+    """Metrics of ``report`` that are worse than ``baseline`` by more than ``tolerance``."""
+    previous = {r["n_documents"]: r for r in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        old = previous.get(result["n_documents"])
+        if old is None:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            new_value, old_value = result.get(metric), old.get(metric)
+            if not new_value or not old_value:
+                continue
+            change = (new_value - old_value) / old_value
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append({"n_documents": result["n_documents"], "metric": metric,
+                                    "baseline": old_value, "current": new_value,
+                                    "change": change})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", default="1000,10000,100000",
+                        help="comma-separated corpus sizes (documents)")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--vocabulary-size", type=int, default=50000)
+    parser.add_argument("--mean-length", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--label", help="free-form label stored in the report")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--compare", help="JSON report to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    report = {
+        "label": args.label,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "parameters": {"queries": args.queries, "k": args.k,
+                       "vocabulary_size": args.vocabulary_size,
+                       "mean_length": args.mean_length, "workers": args.workers,
+                       "seed": args.seed},
+        "results": [],
+    }
+    for size in (int(s) for s in args.sizes.split(",")):
+        with ProcessPoolExecutor(max_workers=1,
+                                 mp_context=multiprocessing.get_context("spawn")) as executor:
+            result = executor.submit(run_size, size, args.queries, args.k, args.vocabulary_size,
+                                     args.mean_length, args.workers, args.seed).result()
+        report["results"].append(result)
+        print(json.dumps(result), file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            report["regressions"] = compare(report, json.load(f), args.tolerance)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 1 if report.get("regressions") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
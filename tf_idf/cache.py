@@ -0,0 +1,130 @@
+"""LRU caches for query vectors and top-k results.
+
+Every entry records the ``generation`` of the index it was computed from.
+Indexes bump their generation when documents are added, updated or deleted,
+so a lookup that finds an entry from an older generation drops it and
+counts a miss. Stale entries therefore expire one by one, without a global
+flush.
+"""
+
+import sys
+import threading
+from collections import OrderedDict
+
+from tf_idf.analysis import term_frequencies
+
+
+def normalize_query(text):
+    """Cache key of a query: its sorted term counts."""
+    return tuple(sorted(term_frequencies(text).items()))
+
+
+def estimate_size(value):
+    """Rough size in bytes of a cached value and the objects it holds."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(estimate_size(item) for item in value)
+    return size
+
+
+class LRUCache:
+    """Least-recently-used cache bounded by entry count and estimated bytes."""
+
+    def __init__(self, max_entries=10000, max_bytes=64 << 20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, generation):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] != generation:
+                self._remove(key)
+                self.invalidations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, generation, value):
+        size = estimate_size(key) + estimate_size(value)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (generation, value, size)
+            self.bytes += size
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        self.bytes -= self._entries.pop(key)[2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+class CachedSearcher:
+    """Text-query front end of an index with query-vector and result caches.
+
+    ``index`` is an :class:`~tf_idf.index.InvertedIndex` or a
+    :class:`~tf_idf.segments.SegmentedIndex`. Both caches use the
+    ``max_entries`` and ``max_bytes`` limits.
+    """
+
+    def __init__(self, index, max_entries=10000, max_bytes=64 << 20):
+        self.index = index
+        self.vectors = LRUCache(max_entries, max_bytes)
+        self.results = LRUCache(max_entries, max_bytes)
+
+    def query_vector(self, text):
+        return self._query_vector(normalize_query(text))
+
+    def _query_vector(self, key):
+        generation = self.index.generation
+        weights = self.vectors.get(key, generation)
+        if weights is None:
+            weights = self.index.weigh_query(dict(key))
+            self.vectors.put(key, generation, weights)
+        return weights
+
+    def search(self, text, k=10):
+        query = normalize_query(text)
+        key = (query, k)
+        generation = self.index.generation
+        top = self.results.get(key, generation)
+        if top is None:
+            top = self.index.search(self._query_vector(query), k)
+            self.results.put(key, generation, top)
+        return list(top)
+
+    def stats(self):
+        return {"query_vectors": self.vectors.stats(), "results": self.results.stats()}
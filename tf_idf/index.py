@@ -0,0 +1,351 @@
+"""Inverted index over a :class:`~tf_idf.matrix.TermMatrix`."""
+
+import numpy as np
+
+from tf_idf.instrumentation import instrumentation
+
+
+class InvertedIndex:
+    """Term -> postings list of ``(doc, weight)`` pairs.
+
+    The postings are the columns of the document-term matrix, stored
+    contiguously: the postings of term id ``t`` are
+    ``doc_rows[term_ptr[t]:term_ptr[t + 1]]`` (ascending) together with the
+    same slice of ``weights``. ``doc_rows`` are row numbers into ``doc_ids``.
+    The index is immutable, so its ``generation`` is always 0.
+    """
+
+    generation = 0
+
+    def __init__(self, matrix, idf=None):
+        rows = np.repeat(np.arange(len(matrix.doc_ids), dtype=np.int32),
+                         np.diff(matrix.indptr))
+        order = np.argsort(matrix.indices, kind="stable")
+        term_ptr = np.zeros(len(matrix.vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(matrix.indices, minlength=len(matrix.vocabulary)),
+                  out=term_ptr[1:])
+        self._set_postings(matrix.vocabulary, matrix.doc_ids, term_ptr,
+                           rows[order], matrix.data[order], idf)
+
+    @classmethod
+    def from_postings(cls, vocabulary, doc_ids, term_ptr, doc_rows, weights, idf=None,
+                      max_weights=None, doc_norms=None):
+        """Wrap postings arrays that are already laid out term by term.
+
+        The arrays are used as they are, so memory-mapped arrays stay on disk.
+        """
+        index = cls.__new__(cls)
+        index._set_postings(vocabulary, doc_ids, term_ptr, doc_rows, weights, idf,
+                            max_weights, doc_norms)
+        return index
+
+    def _set_postings(self, vocabulary, doc_ids, term_ptr, doc_rows, weights, idf,
+                      max_weights=None, doc_norms=None):
+        self.vocabulary = vocabulary
+        self.doc_ids = doc_ids
+        self.idf = None if idf is None else np.asarray(idf, dtype=np.float64)
+        self.term_ptr = np.asarray(term_ptr, dtype=np.int64)
+        self.doc_rows = np.asarray(doc_rows, dtype=np.int32)
+        self.weights = np.asarray(weights, dtype=np.float64)
+        if max_weights is None:
+            max_weights = _segment_max(self.weights, self.term_ptr)
+        self.max_weights = np.asarray(max_weights, dtype=np.float64)
+        self._doc_norms = doc_norms
+
+    @property
+    def doc_norms(self):
+        """Euclidean length of every document's weight vector."""
+        if self._doc_norms is None:
+            self._doc_norms = _doc_norms(self.doc_rows, self.weights, len(self.doc_ids))
+        return self._doc_norms
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    @property
+    def n_documents(self):
+        return len(self.doc_ids)
+
+    def rows_of(self, doc_ids):
+        """Sorted, unique row numbers of the given document ids."""
+        if getattr(self, "_row_by_id", None) is None:
+            self._row_by_id = {doc_id: row for row, doc_id in enumerate(self.doc_ids)}
+        try:
+            rows = [self._row_by_id[doc_id] for doc_id in doc_ids]
+        except KeyError as error:
+            raise KeyError(f"Document {error.args[0]!r} is not indexed") from None
+        return np.unique(np.asarray(rows, dtype=np.int32))
+
+    def postings(self, term):
+        term_id = self.vocabulary.get(term)
+        if term_id is None:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float64)
+        start, end = self.term_ptr[term_id], self.term_ptr[term_id + 1]
+        return self.doc_rows[start:end], self.weights[start:end]
+
+    def document_frequency(self, term):
+        term_id = self.vocabulary.get(term)
+        if term_id is None:
+            return 0
+        return int(self.term_ptr[term_id + 1] - self.term_ptr[term_id])
+
+    def count_relevant(self, terms, relevant_doc_ids):
+        """For every term, how many of ``relevant_doc_ids`` contain it.
+
+        Each postings list is intersected with the sorted relevant rows by
+        binary search, so the cost depends on the postings of ``terms`` and
+        the size of the relevant set only.
+        """
+        relevant = self.rows_of(relevant_doc_ids)
+        counts = np.zeros(len(terms), dtype=np.int64)
+        for i, term in enumerate(terms):
+            counts[i] = _count_common(self.postings(term)[0], relevant)
+        return counts
+
+    def weigh_query(self, term_counts):
+        """Turn query term counts into ``{term: tf * idf}`` query weights."""
+        if self.idf is None:
+            raise ValueError("the index was built without idf weights")
+        with instrumentation.stage("weighting"):
+            return {term: count * self.idf[self.vocabulary[term]]
+                    for term, count in term_counts.items()
+                    if term in self.vocabulary}
+
+    def score_rows(self, query_weights):
+        """Term-at-a-time inner product ``SC(Q, D_i)``.
+
+        Only the postings of the query terms are visited; returns the row
+        numbers of the matching documents and their accumulated scores.
+        """
+        with instrumentation.stage("postings"):
+            rows = []
+            contributions = []
+            for term, weight in query_weights.items():
+                term_rows, term_weights = self.postings(term)
+                rows.append(term_rows)
+                contributions.append(weight * term_weights)
+
+            if not rows:
+                return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float64)
+            rows = np.concatenate(rows)
+            matched, accumulator = np.unique(rows, return_inverse=True)
+            scores = np.bincount(accumulator, weights=np.concatenate(contributions),
+                                 minlength=len(matched))
+        if instrumentation.enabled:
+            instrumentation.count("postings_scanned", len(rows))
+            instrumentation.count("accumulators_touched", len(matched))
+        return matched, scores
+
+    def score(self, query_weights):
+        rows, scores = self.score_rows(query_weights)
+        return {self.doc_ids[row]: score for row, score in zip(rows.tolist(), scores.tolist())}
+
+    def search(self, query_weights, k=10, exhaustive=False, rows=False):
+        """Top-``k`` documents for the query as ``[(doc_id, score), ...]``.
+
+        By default documents are scored with MaxScore dynamic pruning, which
+        skips documents whose score upper bound cannot enter the current
+        top-``k``. ``exhaustive=True`` scores every matching document instead
+        and returns the same ranking; ties are broken by document order.
+        With ``rows=True`` the results hold row numbers instead of doc ids.
+        """
+        if k <= 0:
+            return []
+        if exhaustive or any(weight < 0 for weight in query_weights.values()):
+            matched, scores = self.score_rows(query_weights)
+            with instrumentation.stage("top_k"):
+                top = _top_k(matched, scores, k)
+        else:
+            top = self._max_score(query_weights, k)
+        if rows:
+            return top
+        return [(self.doc_ids[row], score) for row, score in top]
+
+    def search_batch(self, queries, k=10, max_products=1 << 24):
+        """Top-``k`` documents for every query in ``queries``.
+
+        The queries are weighted with :meth:`weigh_query`, turned into one
+        sparse query-term matrix that keeps each query's term order, and
+        scored against all documents with a sparse matrix product, so the
+        scores equal those of :meth:`search`. Queries are processed in chunks
+        of at most ``max_products`` posting visits to bound memory. Returns
+        one ``[(doc_id, score), ...]`` list per query.
+        """
+        return self.search_vectors([self.weigh_query(query) for query in queries], k,
+                                   max_products=max_products)
+
+    def search_vectors(self, query_weights, k=10, binary=False, max_products=1 << 24,
+                       rows=False):
+        """Like :meth:`search_batch`, for already weighted ``{term: weight}`` queries.
+
+        With ``binary`` every posting counts as 1 instead of its tf-idf
+        weight, so a document scores the sum of the weights of the query
+        terms it contains (as in :class:`~tf_idf.bayesian.FeedbackSession`).
+        The contributions of a document are summed in query order, so the
+        scores equal those of :meth:`search`. With ``rows=True`` the results
+        hold row numbers instead of doc ids.
+        """
+        indptr = [0]
+        indices = []
+        data = []
+        for weights in query_weights:
+            for term, weight in weights.items():
+                term_id = self.vocabulary.get(term)
+                if term_id is not None:
+                    indices.append(term_id)
+                    data.append(weight)
+            indptr.append(len(indices))
+        return self._search_matrix(np.array(indptr, dtype=np.int64),
+                                   np.array(indices, dtype=np.int64),
+                                   np.array(data, dtype=np.float64), k, max_products, binary,
+                                   rows)
+
+    def _search_matrix(self, indptr, indices, data, k, max_products, binary=False, rows=False):
+        n_queries = len(indptr) - 1
+        results = [[] for _ in range(n_queries)]
+        if k <= 0 or not n_queries:
+            return results
+
+        lengths = self.term_ptr[indices + 1] - self.term_ptr[indices]
+        query_rows = np.repeat(np.arange(n_queries), np.diff(indptr))
+        products = np.bincount(query_rows, weights=lengths, minlength=n_queries)
+        instrumentation.count("postings_scanned", int(lengths.sum()))
+
+        start = 0
+        while start < n_queries:
+            end = start + 1
+            budget = products[start]
+            while end < n_queries and budget + products[end] <= max_products:
+                budget += products[end]
+                end += 1
+            chunk = slice(indptr[start], indptr[end])
+            with instrumentation.stage("batch"):
+                for q, top in self._score_chunk(query_rows[chunk], indices[chunk],
+                                                data[chunk], k, binary):
+                    results[q] = top if rows else [(self.doc_ids[row], score)
+                                                   for row, score in top]
+            start = end
+        return results
+
+    def _score_chunk(self, query_rows, term_ids, query_weights, k, binary=False):
+        starts = self.term_ptr[term_ids]
+        lengths = self.term_ptr[term_ids + 1] - starts
+        owner = np.repeat(np.arange(len(term_ids)), lengths)
+        offsets = np.arange(len(owner)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        positions = starts[owner] + offsets
+
+        n_docs = max(len(self.doc_ids), 1)
+        keys = query_rows[owner].astype(np.int64) * n_docs + self.doc_rows[positions]
+        cells, accumulator = np.unique(keys, return_inverse=True)
+        instrumentation.count("accumulators_touched", len(cells))
+        if not len(cells):
+            return
+        contributions = query_weights[owner]
+        if not binary:
+            contributions = contributions * self.weights[positions]
+        scores = np.bincount(accumulator, weights=contributions, minlength=len(cells))
+
+        queries, rows = np.divmod(cells, n_docs)
+        order = np.lexsort((rows, -scores, queries))
+        queries, rows, scores = queries[order], rows[order], scores[order]
+        bounds = np.flatnonzero(np.diff(queries)) + 1
+        for group_start, group_end in zip(np.r_[0, bounds], np.r_[bounds, len(queries)]):
+            group_end = min(group_end, group_start + k)
+            yield (int(queries[group_start]),
+                   list(zip(rows[group_start:group_end].tolist(),
+                            scores[group_start:group_end].tolist())))
+
+    def _max_score(self, query_weights, k):
+        terms = []
+        for position, (term, weight) in enumerate(query_weights.items()):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = self.term_ptr[term_id], self.term_ptr[term_id + 1]
+            terms.append((weight * self.max_weights[term_id], position, weight,
+                          self.doc_rows[start:end], self.weights[start:end]))
+        if not terms:
+            return []
+        in_query_order = sorted(terms, key=lambda t: t[1])
+        terms.sort(key=lambda t: t[0])
+        prefix_bounds = np.cumsum([t[0] for t in terms])
+
+        # Fully score the best postings of the strongest term: the k-th best
+        # of those scores is a lower bound of the final top-k threshold.
+        _, _, _, rows, weights = terms[-1]
+        threshold = -np.inf
+        if len(rows) >= k:
+            seeds = np.sort(rows[np.argpartition(weights, len(weights) - k)[-k:]])
+            threshold = np.min(_lookup_scores(seeds, in_query_order))
+
+        # Terms whose summed upper bounds stay below the threshold are
+        # non-essential: a document matching only those cannot make the
+        # top-k, so candidates come from the essential postings only.
+        # The slack keeps rounding differences between the bounds (summed in
+        # bound order) and the scores (summed in query order) from pruning.
+        threshold -= 1e-9 * abs(threshold) + 1e-12
+        n_non_essential = min(int(np.searchsorted(prefix_bounds, threshold, side="left")),
+                              len(terms) - 1)
+        essential = {t[1] for t in terms[n_non_essential:]}
+        rows, scores = self.score_rows({term: weight for position, (term, weight)
+                                        in enumerate(query_weights.items())
+                                        if position in essential})
+        if n_non_essential:
+            # Drop candidates whose upper bound is below the threshold, then
+            # re-add every contribution in query order so the scores are
+            # bit-identical to the exhaustive accumulator.
+            survivors = rows[scores + prefix_bounds[n_non_essential - 1] >= threshold]
+            instrumentation.count("documents_pruned", len(rows) - len(survivors))
+            rows, scores = survivors, _lookup_scores(survivors, in_query_order)
+        with instrumentation.stage("top_k"):
+            return _top_k(rows, scores, k)
+
+
+def _lookup_scores(rows, terms):
+    """Inner products of sorted ``rows``, summed over ``terms`` in order."""
+    with instrumentation.stage("postings"):
+        scores = np.zeros(len(rows), dtype=np.float64)
+        for _, _, weight, term_rows, term_weights in terms:
+            if not len(term_rows):
+                continue
+            instrumentation.count("postings_looked_up", len(rows))
+            positions = np.minimum(np.searchsorted(term_rows, rows), len(term_rows) - 1)
+            found = term_rows[positions] == rows
+            scores = scores + np.where(found, weight * term_weights[positions], 0.0)
+        return scores
+
+
+def _count_common(sorted_a, sorted_b):
+    if len(sorted_a) > len(sorted_b):
+        sorted_a, sorted_b = sorted_b, sorted_a
+    if not len(sorted_a):
+        return 0
+    positions = np.searchsorted(sorted_b, sorted_a)
+    positions[positions == len(sorted_b)] = 0
+    return int(np.count_nonzero(sorted_b[positions] == sorted_a))
+
+
+def _doc_norms(doc_rows, weights, n_docs, chunk_size=1 << 22):
+    squares = np.zeros(n_docs, dtype=np.float64)
+    for start in range(0, len(weights), chunk_size):
+        chunk = np.asarray(weights[start:start + chunk_size])
+        squares += np.bincount(doc_rows[start:start + chunk_size], weights=chunk * chunk,
+                               minlength=n_docs)
+    return np.sqrt(squares)
+
+
+def _segment_max(values, ptr):
+    maxima = np.zeros(len(ptr) - 1, dtype=np.float64)
+    non_empty = np.flatnonzero(np.diff(ptr) > 0)
+    if len(non_empty):
+        maxima[non_empty] = np.maximum.reduceat(values, ptr[non_empty])
+    return maxima
+
+
+def _top_k(rows, scores, k):
+    if len(scores) > k:
+        kth = np.partition(scores, len(scores) - k)[len(scores) - k]
+        keep = scores >= kth
+        rows, scores = rows[keep], scores[keep]
+    order = np.lexsort((rows, -scores))[:k]
+    return list(zip(rows[order].tolist(), scores[order].tolist()))
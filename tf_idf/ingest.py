@@ -0,0 +1,289 @@
+"""Streaming corpus ingestion and out-of-core index building.
+
+Documents are read lazily as ``(doc_id, text)`` pairs. :class:`IndexBuilder`
+tokenizes and counts them one at a time, buffers the raw postings up to a
+memory budget, flushes each full buffer to disk as a sorted run and merges
+the runs into the final :class:`~tf_idf.index.InvertedIndex`.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+from array import array
+from collections import deque
+from pathlib import Path
+
+import numpy as np
+
+from tf_idf import storage
+from tf_idf.analysis import Analyzer
+from tf_idf.index import InvertedIndex
+
+# term id, doc row and term frequency, stored as int32 while buffered.
+POSTING_BYTES = 12
+
+
+def read_lines(path, encoding="utf-8"):
+    """One document per non-empty line, identified by its line number."""
+    with open(path, encoding=encoding) as f:
+        for line_number, line in enumerate(f):
+            line = line.rstrip("\n")
+            if line.strip():
+                yield line_number, line
+
+
+def read_jsonl(path, text_field="text", id_field="id", encoding="utf-8"):
+    """One JSON object per line; the id falls back to the line number."""
+    with open(path, encoding=encoding) as f:
+        for line_number, line in enumerate(f):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            yield record.get(id_field, line_number), record[text_field]
+
+
+def read_directory(path, pattern="*", encoding="utf-8"):
+    """One document per file below ``path``, identified by its relative path."""
+    root = Path(path)
+    for file in sorted(p for p in root.rglob(pattern) if p.is_file()):
+        yield file.relative_to(root).as_posix(), file.read_text(encoding=encoding,
+                                                                errors="replace")
+
+
+def read_documents(source, format=None, **kwargs):
+    """Pick a reader from ``format`` ("lines", "jsonl", "directory") or the path."""
+    if format is None:
+        if os.path.isdir(source):
+            format = "directory"
+        elif str(source).endswith((".jsonl", ".ndjson")):
+            format = "jsonl"
+        else:
+            format = "lines"
+    readers = {"lines": read_lines, "jsonl": read_jsonl, "directory": read_directory}
+    if format not in readers:
+        raise ValueError(f"Unknown document format: {format!r}")
+    return readers[format](source, **kwargs)
+
+
+class IndexBuilder:
+    """Build an inverted index with a bounded posting buffer.
+
+    At most ``memory_budget`` bytes of postings are buffered before they are
+    sorted by term and written to ``run_dir`` (a temporary directory by
+    default). The vocabulary, document-frequency table and doc-id list stay
+    in memory.
+    """
+
+    def __init__(self, memory_budget=64 << 20, run_dir=None):
+        self.analyzer = Analyzer()
+        self.max_buffered = max(memory_budget // POSTING_BYTES, 1)
+        self.run_dir = run_dir
+        self.doc_ids = []
+        self.runs = []
+        self._shards = 0
+        self._temporary_dir = None
+        self._reset_buffer()
+
+    @property
+    def statistics(self):
+        return self.analyzer.statistics
+
+    def _reset_buffer(self):
+        self._term_ids = array("i")
+        self._doc_rows = array("i")
+        self._tfs = array("i")
+
+    def add(self, doc_id, text):
+        counts = self.analyzer.analyze(text)
+        row = len(self.doc_ids)
+        self.doc_ids.append(doc_id)
+
+        vocabulary = self.analyzer.vocabulary
+        for term, count in counts.items():
+            self._term_ids.append(vocabulary[term])
+            self._doc_rows.append(row)
+            self._tfs.append(count)
+        if len(self._tfs) >= self.max_buffered:
+            self.flush()
+
+    def add_documents(self, documents):
+        for doc_id, text in documents:
+            self.add(doc_id, text)
+        return self
+
+    def _directory(self):
+        if self.run_dir is not None:
+            os.makedirs(self.run_dir, exist_ok=True)
+            return self.run_dir
+        if self._temporary_dir is None:
+            self._temporary_dir = tempfile.mkdtemp(prefix="tf_idf-runs-")
+        return self._temporary_dir
+
+    def flush(self):
+        """Write the buffered postings to disk as one run sorted by term id."""
+        if not len(self._tfs):
+            return
+        self._write_run(np.array(self._term_ids, dtype=np.int32),
+                        np.array(self._doc_rows, dtype=np.int32),
+                        np.array(self._tfs, dtype=np.int32))
+        self._reset_buffer()
+
+    def _write_run(self, term_ids, doc_rows, tfs):
+        path = os.path.join(self._directory(), f"run-{len(self.runs):06d}.npz")
+        _save_run(path, term_ids, doc_rows, tfs)
+        self.runs.append((path, None, 0))
+
+    def shard_run_path(self):
+        """Path for the run of the next shard, see :func:`index_shard`."""
+        self._shards += 1
+        return os.path.join(self._directory(), f"shard-{self._shards:06d}.npz")
+
+    def add_shard(self, doc_ids, shard):
+        """Append the documents of a shard indexed by :func:`index_shard`.
+
+        The shard's vocabulary is merged in its first-seen order, so term ids,
+        statistics and postings match adding the documents one by one. The
+        shard's run keeps its local term ids and rows; they are mapped to the
+        global ones while :meth:`finish` merges the runs.
+        """
+        self.flush()
+        terms, df, run_path = shard
+        term_map = self.statistics.merge_counts(terms, df, len(doc_ids))
+        if run_path is not None:
+            self.runs.append((run_path, term_map, len(self.doc_ids)))
+        self.doc_ids.extend(doc_ids)
+
+    def finish(self, output=None, idf=None):
+        """Merge all runs into an :class:`InvertedIndex` and delete them.
+
+        Runs hold increasing doc rows, so each term's postings are the
+        concatenation of its slices in run order and are written straight
+        to their final position, one run in memory at a time. With
+        ``output`` the postings are merged into memory-mapped arrays of an
+        on-disk index (see :mod:`tf_idf.storage`) that is then loaded.
+        ``idf``, indexed by this builder's term ids, replaces the idf of its
+        own statistics, e.g. with the idf of a whole sharded collection.
+        """
+        self.flush()
+        statistics = self.statistics
+        n_terms = len(statistics)
+        idf = statistics.idf() if idf is None else np.asarray(idf, dtype=np.float64)
+
+        term_ptr = np.zeros(n_terms + 1, dtype=np.int64)
+        np.cumsum(statistics.df, out=term_ptr[1:])
+        if output is None:
+            doc_rows = np.empty(term_ptr[-1], dtype=np.int32)
+            weights = np.empty(term_ptr[-1], dtype=np.float64)
+        else:
+            doc_rows = storage.create_array(output, "doc_rows", term_ptr[-1])
+            weights = storage.create_array(output, "weights", term_ptr[-1])
+        filled = term_ptr[:-1].copy()
+
+        for path, term_map, row_offset in self.runs:
+            with np.load(path) as run:
+                term_ids, rows, tfs = run["term_ids"], run["doc_rows"], run["tfs"]
+            # A run is sorted by its own term ids. Mapping them to global ids
+            # keeps every term's postings contiguous, so each is written at
+            # its offset within the term's run slice.
+            run_counts = np.bincount(term_ids, minlength=n_terms if term_map is None
+                                     else len(term_map))
+            run_starts = np.cumsum(run_counts) - run_counts
+            offsets = np.arange(len(term_ids)) - run_starts[term_ids]
+            if term_map is not None:
+                term_ids = term_map[term_ids]
+                rows = rows + np.int32(row_offset)
+                run_counts, local_counts = np.zeros(n_terms, dtype=np.int64), run_counts
+                run_counts[term_map] = local_counts
+            positions = filled[term_ids] + offsets
+            doc_rows[positions] = rows
+            weights[positions] = tfs * idf[term_ids]
+            filled += run_counts
+            os.remove(path)
+        self.runs = []
+        if self._temporary_dir is not None:
+            shutil.rmtree(self._temporary_dir, ignore_errors=True)
+            self._temporary_dir = None
+
+        if output is not None:
+            storage.write_index(output, statistics.vocabulary, self.doc_ids, term_ptr,
+                                doc_rows, weights, idf)
+            del doc_rows, weights
+            return storage.load_index(output)
+        return InvertedIndex.from_postings(dict(statistics.vocabulary), self.doc_ids,
+                                           term_ptr, doc_rows, weights, idf)
+
+
+def _save_run(path, term_ids, doc_rows, tfs):
+    order = np.argsort(term_ids, kind="stable")
+    np.savez(path, term_ids=term_ids[order], doc_rows=doc_rows[order], tfs=tfs[order])
+
+
+def index_shard(texts, run_path):
+    """Tokenize and count a shard of documents with a shard-local vocabulary.
+
+    The shard's postings are sorted and written to ``run_path`` as a run
+    with local term ids and rows, so the parent process does no per-posting
+    work for them. Returns the shard's terms in local-id order, their
+    document frequencies and the run's path (None for a shard without
+    postings).
+    """
+    analyzer = Analyzer()
+    term_ids = array("i")
+    doc_rows = array("i")
+    tfs = array("i")
+    vocabulary = analyzer.vocabulary
+    for row, text in enumerate(texts):
+        for term, count in analyzer.analyze(text).items():
+            term_ids.append(vocabulary[term])
+            doc_rows.append(row)
+            tfs.append(count)
+    if len(tfs):
+        _save_run(run_path, np.array(term_ids, dtype=np.int32),
+                  np.array(doc_rows, dtype=np.int32), np.array(tfs, dtype=np.int32))
+    else:
+        run_path = None
+    return list(vocabulary), analyzer.statistics.df.copy(), run_path
+
+
+def _chunks(documents, chunk_size):
+    doc_ids = []
+    texts = []
+    for doc_id, text in documents:
+        doc_ids.append(doc_id)
+        texts.append(text)
+        if len(texts) == chunk_size:
+            yield doc_ids, texts
+            doc_ids = []
+            texts = []
+    if texts:
+        yield doc_ids, texts
+
+
+def build_index(documents, memory_budget=64 << 20, run_dir=None, output=None,
+                workers=1, chunk_size=10000):
+    """Index an iterable of ``(doc_id, text)`` pairs, e.g. from :func:`read_documents`.
+
+    With ``workers > 1`` the stream is cut into shards of ``chunk_size``
+    documents that are tokenized and counted by a process pool, and merged
+    in stream order. The result is identical to the serial build. At most
+    ``2 * workers`` shards are in flight at a time.
+    """
+    builder = IndexBuilder(memory_budget, run_dir)
+    if workers <= 1:
+        return builder.add_documents(documents).finish(output)
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for doc_ids, texts in _chunks(documents, chunk_size):
+            pending.append((doc_ids, executor.submit(index_shard, texts,
+                                                     builder.shard_run_path())))
+            if len(pending) >= 2 * workers:
+                doc_ids, future = pending.popleft()
+                builder.add_shard(doc_ids, future.result())
+        while pending:
+            doc_ids, future = pending.popleft()
+            builder.add_shard(doc_ids, future.result())
+    return builder.finish(output)
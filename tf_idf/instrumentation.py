@@ -0,0 +1,135 @@
+"""Opt-in timers, counters and profiling hooks for the hot paths.
+
+The package reports to the module-level :data:`instrumentation` object.
+It is disabled by default, and then each instrumented call site costs one
+attribute check. Once enabled it accumulates the time spent in each stage
+(``tokenize``, ``weighting``, ``postings``, ``top_k``, ``batch``) and
+counters such as ``documents_tokenized``, ``postings_scanned`` (postings
+read in full), ``postings_looked_up`` (binary-search probes),
+``accumulators_touched`` and ``documents_pruned``. Stages do not nest, so
+each second is counted in one stage only; tokenizing a query counts
+towards ``tokenize`` but not ``documents_tokenized``::
+
+    from tf_idf.instrumentation import instrumentation
+
+    instrumentation.enable()
+    instrumentation.profile("postings")  # run this stage under cProfile
+    ...
+    instrumentation.stats()
+    instrumentation.profiles["postings"].print_stats(10)
+
+Counters are per process: work done in a process pool (``build_index``
+with ``workers > 1``) is not included. :mod:`cProfile` is only imported
+once a stage is profiled with the default profiler.
+"""
+
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+_DISABLED = nullcontext()
+
+
+def _cprofile():
+    import cProfile
+
+    return cProfile.Profile()
+
+
+class Instrumentation:
+    def __init__(self):
+        self.enabled = False
+        self.profiles = {}
+        self._profilers = {}
+        self._lock = threading.Lock()
+        self.reset()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self.seconds = defaultdict(float)
+            self.calls = defaultdict(int)
+            self.counters = defaultdict(int)
+
+    def count(self, name, value=1):
+        if self.enabled:
+            with self._lock:
+                self.counters[name] += value
+
+    def stage(self, name):
+        """Context manager that times one run of the stage ``name``."""
+        if not self.enabled:
+            return _DISABLED
+        return self._timed(name)
+
+    @contextmanager
+    def _timed(self, name):
+        factory = self._profilers.get(name)
+        profiler = factory() if factory is not None else None
+        if profiler is not None:
+            _start(profiler)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            if profiler is not None:
+                _stop(profiler)
+                self._collect(name, profiler)
+            with self._lock:
+                self.seconds[name] += elapsed
+                self.calls[name] += 1
+
+    def profile(self, stage, profiler=_cprofile):
+        """Run every call of ``stage`` under a profiler made by ``profiler()``.
+
+        The default collects cProfile data into ``profiles[stage]`` as a
+        :class:`pstats.Stats`. Any factory whose profilers have
+        ``enable``/``disable`` or ``start``/``stop`` methods works, e.g. a
+        sampling profiler; non-cProfile profilers are kept as a list in
+        ``profiles[stage]``. Pass ``profiler=None`` to stop profiling.
+        """
+        if profiler is None:
+            self._profilers.pop(stage, None)
+        else:
+            self._profilers[stage] = profiler
+
+    def _collect(self, name, profiler):
+        import cProfile
+        import pstats
+
+        with self._lock:
+            if isinstance(profiler, cProfile.Profile):
+                if name in self.profiles:
+                    self.profiles[name].add(profiler)
+                else:
+                    self.profiles[name] = pstats.Stats(profiler)
+            else:
+                self.profiles.setdefault(name, []).append(profiler)
+
+    def stats(self):
+        """Snapshot of all timers and counters, ready to export as metrics."""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "stages": {name: {"calls": self.calls[name], "seconds": seconds}
+                           for name, seconds in self.seconds.items()},
+                "counters": dict(self.counters),
+            }
+
+
+def _start(profiler):
+    (profiler.enable if hasattr(profiler, "enable") else profiler.start)()
+
+
+def _stop(profiler):
+    (profiler.disable if hasattr(profiler, "disable") else profiler.stop)()
+
+
+instrumentation = Instrumentation()
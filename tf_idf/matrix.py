@@ -0,0 +1,88 @@
+"""Sparse document-term matrix in compressed sparse row (CSR) layout."""
+
+import numpy as np
+
+from tf_idf.instrumentation import instrumentation
+
+
+class TermMatrix:
+    """Document-term weights stored as CSR arrays.
+
+    Row ``i`` holds the non-zero weights of ``doc_ids[i]``; its term ids are
+    ``indices[indptr[i]:indptr[i + 1]]`` (sorted) and the matching weights are
+    the same slice of ``data``. ``vocabulary`` maps a term to its column id.
+    """
+
+    def __init__(self, indptr, indices, data, vocabulary, doc_ids):
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.data = np.asarray(data, dtype=np.float64)
+        self.vocabulary = vocabulary
+        self.doc_ids = list(doc_ids)
+
+    @property
+    def shape(self):
+        return len(self.doc_ids), len(self.vocabulary)
+
+    @property
+    def nnz(self):
+        return len(self.data)
+
+    def terms(self):
+        terms = [None] * len(self.vocabulary)
+        for term, term_id in self.vocabulary.items():
+            terms[term_id] = term
+        return terms
+
+    def row(self, i):
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return self.indices[start:end], self.data[start:end]
+
+    def weighted(self, idf):
+        """Return ``tf * idf`` as a new matrix; ``idf`` is indexed by term id."""
+        idf = np.asarray(idf, dtype=np.float64)
+        if len(idf) != len(self.vocabulary):
+            raise ValueError("idf length does not match the vocabulary size")
+        with instrumentation.stage("weighting"):
+            data = self.data * idf[self.indices]
+        return TermMatrix(self.indptr, self.indices, data, self.vocabulary, self.doc_ids)
+
+    def to_scipy(self):
+        from scipy.sparse import csr_matrix
+
+        return csr_matrix((self.data, self.indices, self.indptr), shape=self.shape)
+
+    def to_dataframe(self):
+        """Dense pandas view, only meant for small corpora."""
+        import pandas as pd
+
+        dense = np.zeros(self.shape, dtype=np.float64)
+        rows = np.repeat(np.arange(len(self.doc_ids)), np.diff(self.indptr))
+        dense[rows, self.indices] = self.data
+        return pd.DataFrame(dense, index=self.doc_ids, columns=self.terms())
+
+
+def build_term_matrix(term_counts, vocabulary, idf=None):
+    """Build a :class:`TermMatrix` from per-document term counts.
+
+    ``term_counts`` maps a document id to a ``{term: count}`` mapping, terms
+    missing from ``vocabulary`` are dropped. When ``idf`` is given the counts
+    are weighted in a single vectorized multiply.
+    """
+    doc_ids = list(term_counts)
+    indptr = np.zeros(len(doc_ids) + 1, dtype=np.int64)
+    indices = []
+    data = []
+
+    for i, doc_id in enumerate(doc_ids):
+        row = sorted((vocabulary[term], count)
+                     for term, count in term_counts[doc_id].items()
+                     if term in vocabulary)
+        indices.extend(term_id for term_id, _ in row)
+        data.extend(count for _, count in row)
+        indptr[i + 1] = len(indices)
+
+    matrix = TermMatrix(indptr, indices, data, vocabulary, doc_ids)
+    if idf is not None:
+        matrix = matrix.weighted(idf)
+    return matrix
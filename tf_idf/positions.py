@@ -0,0 +1,269 @@
+"""Positional postings for phrase and proximity queries.
+
+:class:`PositionalIndex` stores, for every term and document containing
+it, the word positions of the term as varint-encoded gaps (see
+:func:`~tf_idf.compressed.encode_varints`). A query first intersects the
+document rows of its terms, rarest term first, by searching the surviving
+rows in each longer postings list; only the position lists of the
+documents left after the intersection are decoded.
+
+Positions count every word, including the one-letter words that
+:func:`~tf_idf.analysis.tokenize` drops, so a phrase never matches across a
+dropped word.
+
+Rows are positions in the document stream, so an index built from the same
+stream as :func:`~tf_idf.ingest.build_index` lines up with its rows and
+doc ids, and :meth:`PositionalIndex.rescore` can filter or boost the
+results of :meth:`~tf_idf.index.InvertedIndex.search`.
+"""
+
+import re
+from array import array
+
+import numpy as np
+
+from tf_idf.compressed import decode_varints, encode_varints, varint_lengths
+from tf_idf.instrumentation import instrumentation
+
+WORD_PATTERN = re.compile(r"(?u)\w+")
+
+
+def _positioned_tokens(text):
+    """Tokens of :func:`~tf_idf.analysis.tokenize` and their word positions.
+
+    A token is a word of two or more characters, so the positions of the
+    shorter words are left as gaps.
+    """
+    tokens = []
+    positions = []
+    for position, word in enumerate(WORD_PATTERN.findall(text.lower())):
+        if len(word) > 1:
+            tokens.append(word)
+            positions.append(position)
+    return tokens, positions
+
+
+class PositionalIndex:
+    """Term -> documents -> word positions, built from ``(doc_id, text)`` pairs.
+
+    The postings of term id ``t`` are ``doc_rows[term_ptr[t]:term_ptr[t + 1]]``
+    (ascending); the positions of posting ``i`` are stored in
+    ``position_bytes[byte_ptr[i]:byte_ptr[i + 1]]`` as the first position
+    followed by the gaps between consecutive positions.
+    """
+
+    def __init__(self, documents):
+        self.vocabulary = {}
+        self.doc_ids = []
+        term_ids = array("i")
+        rows = array("i")
+        positions = array("i")
+        for row, (doc_id, text) in enumerate(documents):
+            self.doc_ids.append(doc_id)
+            tokens, token_positions = _positioned_tokens(text)
+            term_ids.extend(self.vocabulary.setdefault(token, len(self.vocabulary))
+                            for token in tokens)
+            rows.extend([row] * len(tokens))
+            positions.extend(token_positions)
+
+        # Tokens arrive by row and position, so a stable sort by term keeps
+        # every postings list ordered by row and then position.
+        order = np.argsort(np.frombuffer(term_ids, dtype=np.int32), kind="stable")
+        term_ids = np.frombuffer(term_ids, dtype=np.int32)[order]
+        rows = np.frombuffer(rows, dtype=np.int32)[order]
+        positions = np.frombuffer(positions, dtype=np.int32)[order].astype(np.int64)
+
+        starts = np.flatnonzero(np.r_[True, (term_ids[1:] != term_ids[:-1])
+                                      | (rows[1:] != rows[:-1])]) if len(rows) else \
+            np.zeros(0, dtype=np.int64)
+        self.doc_rows = rows[starts]
+        self.term_ptr = np.zeros(len(self.vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids[starts], minlength=len(self.vocabulary)),
+                  out=self.term_ptr[1:])
+
+        gaps = np.diff(positions, prepend=0)
+        gaps[starts] = positions[starts]
+        self.position_bytes = encode_varints(gaps)
+        value_ptr = np.zeros(len(gaps) + 1, dtype=np.int64)
+        np.cumsum(varint_lengths(gaps), out=value_ptr[1:])
+        self.byte_ptr = value_ptr[np.r_[starts, len(gaps)]]
+        self._row_by_id = None
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    @property
+    def n_documents(self):
+        return len(self.doc_ids)
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.term_ptr, self.doc_rows, self.byte_ptr,
+                                      self.position_bytes))
+
+    def document_frequency(self, term):
+        term_id = self.vocabulary.get(term)
+        if term_id is None:
+            return 0
+        return int(self.term_ptr[term_id + 1] - self.term_ptr[term_id])
+
+    def positions(self, term, doc_id):
+        """Word positions of ``term`` in the document ``doc_id``."""
+        term_id = self.vocabulary.get(term)
+        if term_id is None:
+            return np.zeros(0, dtype=np.int64)
+        row = self._rows_of([doc_id])[0]
+        start, end = self.term_ptr[term_id], self.term_ptr[term_id + 1]
+        i = start + int(np.searchsorted(self.doc_rows[start:end], row))
+        if i == end or self.doc_rows[i] != row:
+            return np.zeros(0, dtype=np.int64)
+        return self._decode(np.array([i]))[1]
+
+    def _rows_of(self, doc_ids):
+        if self._row_by_id is None:
+            self._row_by_id = {doc_id: row for row, doc_id in enumerate(self.doc_ids)}
+        try:
+            return [self._row_by_id[doc_id] for doc_id in doc_ids]
+        except KeyError as error:
+            raise KeyError(f"Document {error.args[0]!r} is not indexed") from None
+
+    def _decode(self, postings):
+        """Positions of the given postings, as ``(owner, position)`` arrays.
+
+        ``owner[j]`` is the index into ``postings`` that position ``j``
+        belongs to; positions are ascending per owner.
+        """
+        byte_starts = self.byte_ptr[postings]
+        byte_lengths = self.byte_ptr[postings + 1] - byte_starts
+        byte_positions = np.repeat(byte_starts - (np.cumsum(byte_lengths) - byte_lengths),
+                                   byte_lengths) + np.arange(byte_lengths.sum())
+        encoded = self.position_bytes[byte_positions]
+        running = np.cumsum(decode_varints(encoded))
+        # A value belongs to the posting holding its last byte.
+        owner = np.repeat(np.arange(len(postings)), byte_lengths)[(encoded & 0x80) == 0]
+        before = np.r_[0, running][np.searchsorted(owner, np.arange(len(postings)))]
+        instrumentation.count("positions_decoded", len(running))
+        return owner, running - before[owner]
+
+    def _encoded_size(self, postings):
+        return int((self.byte_ptr[postings + 1] - self.byte_ptr[postings]).sum())
+
+    def _candidates(self, term_ids):
+        """Rows containing every term, and each term's posting index in them.
+
+        Lists are intersected from the shortest up. Each step binary-searches
+        the surviving (sorted) rows in the next list, so its cost depends on
+        the candidates left rather than on the length of the list.
+        """
+        term_ids = list(dict.fromkeys(term_ids))
+        by_length = sorted(term_ids, key=lambda t: self.term_ptr[t + 1] - self.term_ptr[t])
+        first = by_length[0]
+        rows = self.doc_rows[self.term_ptr[first]:self.term_ptr[first + 1]]
+        for term_id in by_length[1:]:
+            if not len(rows):
+                break
+            term_rows = self.doc_rows[self.term_ptr[term_id]:self.term_ptr[term_id + 1]]
+            found = np.minimum(np.searchsorted(term_rows, rows), len(term_rows) - 1)
+            rows = rows[term_rows[found] == rows]
+        postings = {}
+        for term_id in term_ids:
+            start, end = self.term_ptr[term_id], self.term_ptr[term_id + 1]
+            postings[term_id] = start + np.searchsorted(self.doc_rows[start:end], rows)
+        instrumentation.count("phrase_candidates", len(rows))
+        return rows, postings
+
+    def _term_ids(self, terms):
+        term_ids = [self.vocabulary.get(term) for term in terms]
+        return None if not term_ids or None in term_ids else term_ids
+
+    def phrase_rows(self, terms, offsets=None):
+        """Rows containing ``terms`` as consecutive words, and the match counts.
+
+        ``offsets`` are the word positions of the terms within the phrase,
+        ``0, 1, 2, ...`` by default.
+        """
+        term_ids = self._term_ids(terms)
+        if term_ids is None:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int64)
+        rows, postings = self._candidates(term_ids)
+        if not len(rows):
+            return rows, np.zeros(0, dtype=np.int64)
+
+        # A phrase starts at p when term i occurs at p + i for every i, so the
+        # candidate starts of each term are intersected as (row, start) keys.
+        shift = np.int64(1) << 32
+        starts = None
+        offsets = range(len(term_ids)) if offsets is None else \
+            [offset - offsets[0] for offset in offsets]
+        for offset, term_id in sorted(zip(offsets, term_ids),
+                                      key=lambda t: self._encoded_size(postings[t[1]])):
+            owner, positions = self._decode(postings[term_id])
+            keep = positions >= offset
+            keys = owner[keep] * shift + (positions[keep] - offset)
+            starts = keys if starts is None else np.intersect1d(starts, keys,
+                                                                assume_unique=True)
+            if not len(starts):
+                break
+        matched, counts = np.unique(starts // shift, return_counts=True)
+        return rows[matched], counts
+
+    def near_rows(self, terms, distance):
+        """Rows where all ``terms`` occur within a span of ``distance`` words.
+
+        A document matches when some window ``[p, p + distance]`` holds an
+        occurrence of every distinct term, in any order; the counts are the
+        number of such windows starting at an occurrence.
+        """
+        term_ids = self._term_ids(terms)
+        if term_ids is None:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int64)
+        rows, postings = self._candidates(term_ids)
+        if not len(rows):
+            return rows, np.zeros(0, dtype=np.int64)
+
+        shift = np.int64(1) << 32
+        keys = []
+        for term_id in postings:
+            owner, positions = self._decode(postings[term_id])
+            keys.append(owner * shift + positions)
+        # The shortest window holding every term starts at an occurrence, and
+        # the next occurrence of each term at or after it must fit the window.
+        window_starts = np.unique(np.concatenate(keys))
+        inside = np.ones(len(window_starts), dtype=bool)
+        for term_keys in keys:
+            nearest = term_keys[np.minimum(np.searchsorted(term_keys, window_starts),
+                                           len(term_keys) - 1)]
+            inside &= (nearest >= window_starts) & (nearest - window_starts <= distance)
+        matched, counts = np.unique(window_starts[inside] // shift, return_counts=True)
+        return rows[matched], counts
+
+    def phrase(self, text):
+        """Documents containing the phrase ``text`` as ``[(doc_id, count), ...]``."""
+        rows, counts = self.phrase_rows(*_positioned_tokens(text))
+        return [(self.doc_ids[row], count) for row, count in zip(rows.tolist(), counts.tolist())]
+
+    def near(self, text, distance):
+        """Documents with the words of ``text`` within ``distance`` words of each other."""
+        rows, counts = self.near_rows(_positioned_tokens(text)[0], distance)
+        return [(self.doc_ids[row], count) for row, count in zip(rows.tolist(), counts.tolist())]
+
+    def rescore(self, results, text, boost=1.0, distance=None, required=False):
+        """Re-rank ``[(doc_id, score), ...]`` results by phrase or proximity matches.
+
+        Each result gains ``boost`` times its number of matches of the phrase
+        ``text`` (or, with ``distance``, of its words within ``distance``
+        words). With ``required`` results without a match are dropped.
+        Ties keep the order of ``results``.
+        """
+        terms, offsets = _positioned_tokens(text)
+        rows, counts = (self.phrase_rows(terms, offsets) if distance is None
+                        else self.near_rows(terms, distance))
+        matches = dict(zip(rows.tolist(), counts.tolist()))
+        result_rows = self._rows_of([doc_id for doc_id, _ in results])
+        rescored = []
+        for (doc_id, score), row in zip(results, result_rows):
+            count = matches.get(row, 0)
+            if count or not required:
+                rescored.append((doc_id, score + boost * count))
+        rescored.sort(key=lambda result: -result[1])
+        return rescored
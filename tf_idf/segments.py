@@ -0,0 +1,347 @@
+"""Segmented index supporting incremental add, update and delete.
+
+New documents go to a small in-memory buffer. Once it holds
+``buffer_size`` documents it is frozen into an immutable :class:`Segment`.
+Deletes only set a tombstone on the document's segment. Segments are merged
+(dropping tombstoned documents) by size tier, in a background thread by
+default: a segment of ``n`` live documents is in tier ``t`` when
+``buffer_size * merge_factor**t <= n < buffer_size * merge_factor**(t + 1)``,
+and ``merge_factor`` segments of the same tier are merged into one of the
+next tier. Each document is therefore rewritten about
+``log(N / buffer_size) / log(merge_factor)`` times, and there are at most
+``merge_factor - 1`` segments per tier.
+
+Segments store raw term frequencies, and the idf is applied at query time
+from the shared :class:`~tf_idf.statistics.IndexStatistics`. N and df
+therefore always describe the live documents, for both the inner-product
+and the Bayesian scorers.
+"""
+
+import threading
+
+import numpy as np
+
+from tf_idf.analysis import term_frequencies
+from tf_idf.index import InvertedIndex, _count_common, _top_k
+from tf_idf.instrumentation import instrumentation
+from tf_idf.statistics import IndexStatistics
+
+
+class Segment:
+    """Immutable block of documents with forward and inverted tf postings."""
+
+    def __init__(self, doc_ids, doc_ptr, doc_terms, doc_tfs):
+        self.doc_ids = list(doc_ids)
+        self.doc_ptr = np.asarray(doc_ptr, dtype=np.int64)
+        self.doc_terms = np.asarray(doc_terms, dtype=np.int32)
+        self.doc_tfs = np.asarray(doc_tfs, dtype=np.int32)
+        self.deleted = np.zeros(len(self.doc_ids), dtype=bool)
+
+        n_terms = int(self.doc_terms.max()) + 1 if len(self.doc_terms) else 0
+        rows = np.repeat(np.arange(len(self.doc_ids), dtype=np.int32), np.diff(self.doc_ptr))
+        order = np.argsort(self.doc_terms, kind="stable")
+        self.doc_rows = rows[order]
+        self.tfs = self.doc_tfs[order]
+        self.term_ptr = np.zeros(n_terms + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.doc_terms, minlength=n_terms), out=self.term_ptr[1:])
+
+    @classmethod
+    def from_counts(cls, doc_ids, counts):
+        """Build from one ``{term_id: tf}`` mapping per document."""
+        doc_ptr = np.zeros(len(counts) + 1, dtype=np.int64)
+        doc_terms = []
+        doc_tfs = []
+        for i, term_counts in enumerate(counts):
+            for term_id in sorted(term_counts):
+                doc_terms.append(term_id)
+                doc_tfs.append(term_counts[term_id])
+            doc_ptr[i + 1] = len(doc_terms)
+        return cls(doc_ids, doc_ptr, doc_terms, doc_tfs)
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    @property
+    def live_count(self):
+        return len(self.doc_ids) - int(self.deleted.sum())
+
+    def terms_of(self, row):
+        return self.doc_terms[self.doc_ptr[row]:self.doc_ptr[row + 1]]
+
+    def postings(self, term_id):
+        if term_id >= len(self.term_ptr) - 1:
+            return self.doc_rows[:0], self.tfs[:0]
+        start, end = self.term_ptr[term_id], self.term_ptr[term_id + 1]
+        return self.doc_rows[start:end], self.tfs[start:end]
+
+    def score_rows(self, term_weights, idf):
+        """Inner product of the live documents with ``[(term_id, w_q), ...]``."""
+        with instrumentation.stage("postings"):
+            rows = []
+            contributions = []
+            for term_id, weight in term_weights:
+                term_rows, tfs = self.postings(term_id)
+                rows.append(term_rows)
+                contributions.append(weight * (tfs * idf[term_id]))
+            if not rows:
+                return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float64)
+            rows = np.concatenate(rows)
+            matched, accumulator = np.unique(rows, return_inverse=True)
+            scores = np.bincount(accumulator, weights=np.concatenate(contributions),
+                                 minlength=len(matched))
+            live = ~self.deleted[matched]
+        if instrumentation.enabled:
+            instrumentation.count("postings_scanned", len(rows))
+            instrumentation.count("accumulators_touched", len(matched))
+        return matched[live], scores[live]
+
+
+def merge_segments(segments):
+    """Merge segments into one, dropping their tombstoned documents.
+
+    Returns the new segment and, for each of its rows, the ``(segment, row)``
+    it came from.
+    """
+    doc_ids = []
+    sources = []
+    doc_ptr = [np.zeros(1, dtype=np.int64)]
+    doc_terms = []
+    doc_tfs = []
+    offset = 0
+    for segment in segments:
+        live = np.flatnonzero(~segment.deleted)
+        lengths = np.diff(segment.doc_ptr)[live]
+        starts = segment.doc_ptr[live]
+        positions = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) \
+            + np.arange(lengths.sum())
+        doc_terms.append(segment.doc_terms[positions])
+        doc_tfs.append(segment.doc_tfs[positions])
+        doc_ptr.append(offset + np.cumsum(lengths))
+        offset += int(lengths.sum())
+        for row in live.tolist():
+            doc_ids.append(segment.doc_ids[row])
+            sources.append((segment, row))
+    merged = Segment(doc_ids, np.concatenate(doc_ptr),
+                     np.concatenate(doc_terms) if doc_terms else [],
+                     np.concatenate(doc_tfs) if doc_tfs else [])
+    return merged, sources
+
+
+class SegmentedIndex:
+    """Mutable TF-IDF index made of immutable segments plus a write buffer."""
+
+    def __init__(self, buffer_size=1000, merge_factor=8, background_merge=True):
+        self.buffer_size = buffer_size
+        self.merge_factor = merge_factor
+        self.background_merge = background_merge
+        self.statistics = IndexStatistics()
+        self.segments = []
+        self.generation = 0
+        self._buffer = {}
+        self._buffer_segment = None
+        self._locations = {}
+        self._idf = None
+        self._lock = threading.RLock()
+        self._merge_thread = None
+
+    def __len__(self):
+        return self.statistics.n_documents
+
+    def __contains__(self, doc_id):
+        return doc_id in self._buffer or doc_id in self._locations
+
+    @property
+    def n_documents(self):
+        return self.statistics.n_documents
+
+    def document_frequency(self, term):
+        return self.statistics.document_frequency(term)
+
+    def add_documents(self, documents):
+        """Index ``(doc_id, text)`` pairs; ids must not be indexed already."""
+        with self._lock:
+            for doc_id, text in documents:
+                self._add(doc_id, text)
+            self.generation += 1
+            if len(self._buffer) >= self.buffer_size:
+                self.flush()
+
+    def update_document(self, doc_id, text):
+        with self._lock:
+            self._delete(doc_id)
+            self._add(doc_id, text)
+            self.generation += 1
+
+    def delete_document(self, doc_id):
+        with self._lock:
+            self._delete(doc_id)
+            self.generation += 1
+
+    def _add(self, doc_id, text):
+        if doc_id in self:
+            raise ValueError(f"Document {doc_id!r} is already indexed")
+        counts = term_frequencies(text)
+        self.statistics.add_document(counts)
+        instrumentation.count("documents_tokenized")
+        vocabulary = self.statistics.vocabulary
+        self._buffer[doc_id] = {vocabulary[term]: count for term, count in counts.items()}
+        self._buffer_segment = None
+        self._idf = None
+
+    def _delete(self, doc_id):
+        self._idf = None
+        if doc_id in self._buffer:
+            self.statistics.remove_term_ids(list(self._buffer.pop(doc_id)))
+            self._buffer_segment = None
+            return
+        try:
+            segment, row = self._locations.pop(doc_id)
+        except KeyError:
+            raise KeyError(f"Document {doc_id!r} is not indexed") from None
+        segment.deleted[row] = True
+        self.statistics.remove_term_ids(segment.terms_of(row))
+
+    def flush(self):
+        """Freeze the write buffer into a segment."""
+        with self._lock:
+            if not self._buffer:
+                return
+            segment = Segment.from_counts(list(self._buffer), list(self._buffer.values()))
+            for row, doc_id in enumerate(segment.doc_ids):
+                self._locations[doc_id] = (segment, row)
+            self.segments.append(segment)
+            self._buffer = {}
+            self._buffer_segment = None
+            self._maybe_merge()
+
+    def _tier(self, segment):
+        tier = 0
+        bound = self.buffer_size * self.merge_factor
+        while segment.live_count >= bound:
+            tier += 1
+            bound *= self.merge_factor
+        return tier
+
+    def _maybe_merge(self):
+        if len(self.segments) < self.merge_factor:
+            return
+        if self._merge_thread is not None and self._merge_thread.is_alive():
+            return
+        tiers = {}
+        for segment in self.segments:
+            tiers.setdefault(self._tier(segment), []).append(segment)
+        full = [tier for tier, members in tiers.items() if len(members) >= self.merge_factor]
+        if not full:
+            return
+        selected = tiers[min(full)][:self.merge_factor]
+        if self.background_merge:
+            self._merge_thread = threading.Thread(target=self._merge, args=(selected,),
+                                                  daemon=True)
+            self._merge_thread.start()
+        else:
+            self._merge(selected)
+
+    def _merge(self, selected):
+        merged, sources = merge_segments(selected)
+        with self._lock:
+            # Documents deleted or updated while the merge ran keep their
+            # tombstone in the merged segment.
+            for row, (doc_id, source) in enumerate(zip(merged.doc_ids, sources)):
+                if self._locations.get(doc_id) == source:
+                    self._locations[doc_id] = (merged, row)
+                else:
+                    merged.deleted[row] = True
+            position = self.segments.index(selected[0])
+            self.segments = [s for s in self.segments if not any(s is m for m in selected)]
+            self.segments.insert(position, merged)
+            self._merge_thread = None
+            self._maybe_merge()
+
+    def wait_for_merges(self):
+        while True:
+            thread = self._merge_thread
+            if thread is None or thread is threading.current_thread():
+                return
+            thread.join()
+
+    def _searchable_segments(self):
+        with self._lock:
+            if self._buffer and self._buffer_segment is None:
+                self._buffer_segment = Segment.from_counts(list(self._buffer),
+                                                           list(self._buffer.values()))
+            segments = list(self.segments)
+            if self._buffer:
+                segments.append(self._buffer_segment)
+            return segments, self._current_idf()
+
+    def _current_idf(self):
+        """The idf, recomputed only after documents were added or deleted."""
+        with self._lock:
+            if self._idf is None:
+                self._idf = self.statistics.idf()
+            return self._idf
+
+    def count_relevant(self, terms, relevant_doc_ids):
+        """For every term, how many of the live ``relevant_doc_ids`` contain it."""
+        with self._lock:
+            by_segment = {}
+            buffered = []
+            for doc_id in relevant_doc_ids:
+                if doc_id in self._buffer:
+                    buffered.append(self._buffer[doc_id])
+                    continue
+                try:
+                    segment, row = self._locations[doc_id]
+                except KeyError:
+                    raise KeyError(f"Document {doc_id!r} is not indexed") from None
+                by_segment.setdefault(id(segment), (segment, []))[1].append(row)
+
+            vocabulary = self.statistics.vocabulary
+            counts = np.zeros(len(terms), dtype=np.int64)
+            for i, term in enumerate(terms):
+                term_id = vocabulary.get(term)
+                if term_id is None:
+                    continue
+                for segment, rows in by_segment.values():
+                    counts[i] += _count_common(segment.postings(term_id)[0],
+                                               np.unique(np.asarray(rows, dtype=np.int32)))
+                counts[i] += sum(term_id in term_counts for term_counts in buffered)
+            return counts
+
+    def weigh_query(self, term_counts):
+        idf = self._current_idf()
+        vocabulary = self.statistics.vocabulary
+        return {term: count * idf[vocabulary[term]]
+                for term, count in term_counts.items()
+                if term in vocabulary}
+
+    def search(self, query_weights, k=10):
+        """Top-``k`` live documents for the query as ``[(doc_id, score), ...]``."""
+        if k <= 0:
+            return []
+        segments, idf = self._searchable_segments()
+        vocabulary = self.statistics.vocabulary
+        term_weights = [(vocabulary[term], weight) for term, weight in query_weights.items()
+                        if term in vocabulary]
+
+        candidates = []
+        for order, segment in enumerate(segments):
+            rows, scores = segment.score_rows(term_weights, idf)
+            with instrumentation.stage("top_k"):
+                for row, score in _top_k(rows, scores, k):
+                    candidates.append((-score, order, row))
+        candidates.sort()
+        return [(segments[order].doc_ids[row], -score) for score, order, row in candidates[:k]]
+
+    def to_inverted_index(self):
+        """Compact the live documents into a static :class:`InvertedIndex`."""
+        segments, idf = self._searchable_segments()
+        merged, _ = merge_segments(segments)
+        n_terms = len(idf)
+        term_ptr = np.zeros(n_terms + 1, dtype=np.int64)
+        term_ptr[1:len(merged.term_ptr)] = merged.term_ptr[1:]
+        term_ptr[len(merged.term_ptr):] = merged.term_ptr[-1]
+        term_ids = np.repeat(np.arange(n_terms), np.diff(term_ptr))
+        return InvertedIndex.from_postings(dict(self.statistics.vocabulary), merged.doc_ids,
+                                           term_ptr, merged.doc_rows,
+                                           merged.tfs * idf[term_ids], idf)
@@ -0,0 +1,317 @@
+"""Asyncio query server speaking JSON lines over TCP.
+
+Start it from the repository root::
+
+    python -m tf_idf.server corpus.index --port 8765
+
+Every request is one JSON object per line, and every response is one JSON
+line, in request order per connection::
+
+    {"query": "gold silver truck", "k": 10}
+    {"query": "gold silver truck", "model": "bayesian", "relevant": ["d_2"], "weight": "w4"}
+
+    {"results": [["d_2", 0.486], ...]}
+
+``model`` is ``"inner"`` (tf-idf inner product, the default) or
+``"bayesian"`` (sum of the Bayesian term weights of the matched query
+terms, with ``r`` and ``R`` taken from the ``relevant`` documents). An
+``"id"`` in the request is echoed in the response, and a malformed request,
+or a line longer than ``max_request_bytes``, gets ``{"error": ...}``.
+
+Requests from all connections go through one bounded queue. A batcher
+takes what arrives within ``batch_window`` seconds (at most ``max_batch``
+requests) and scores each model's requests with one sparse product on a
+thread pool, so the event loop keeps accepting connections. When the queue
+is full, connections stop being read until it drains, which pushes back on
+the clients through TCP.
+"""
+
+import argparse
+import asyncio
+import json
+import socket
+from concurrent.futures import ThreadPoolExecutor
+
+from tf_idf.analysis import term_frequencies
+from tf_idf.bayesian import CASES, bayesian_weights, relevance_statistics
+from tf_idf.storage import load_index
+
+MODELS = ("inner", "bayesian")
+
+
+def parse_request(line):
+    """Validated request dict of a JSON line; raises ``ValueError``."""
+    request = json.loads(line)
+    if not isinstance(request, dict) or not isinstance(request.get("query"), str):
+        raise ValueError('a request is a JSON object with a "query" string')
+    model = request.setdefault("model", "inner")
+    if model not in MODELS:
+        raise ValueError(f"model must be one of {MODELS}, got {model!r}")
+    k = request.setdefault("k", 10)
+    if isinstance(k, bool) or not isinstance(k, int) or k < 0:
+        raise ValueError(f"k must be a non-negative integer, got {k!r}")
+    if model == "bayesian":
+        if request.setdefault("weight", "w4") not in CASES:
+            raise ValueError(f"weight must be one of {CASES}, got {request['weight']!r}")
+        if not isinstance(request.setdefault("relevant", []), list):
+            raise ValueError('"relevant" must be a list of document ids')
+    return request
+
+
+def score_requests(index, requests):
+    """Results of a batch of parsed requests, one list per request.
+
+    Inner-product requests are scored together with
+    :meth:`~tf_idf.index.InvertedIndex.search_batch`; Bayesian requests are
+    weighted one by one and scored together with
+    :meth:`~tf_idf.index.InvertedIndex.search_vectors`. A Bayesian request
+    that cannot be weighted, e.g. with an unknown document id in
+    ``relevant``, gets its exception as its result and does not affect the
+    rest of the batch.
+    """
+    results = [None] * len(requests)
+    inner = [i for i, request in enumerate(requests) if request["model"] == "inner"]
+    bayesian = [i for i, request in enumerate(requests) if request["model"] == "bayesian"]
+
+    if inner:
+        k = max(requests[i]["k"] for i in inner)
+        batch = index.search_batch([term_frequencies(requests[i]["query"]) for i in inner], k)
+        for i, top in zip(inner, batch):
+            results[i] = top[:requests[i]["k"]]
+
+    weighted = []
+    vectors = []
+    for i in bayesian:
+        try:
+            terms = [term for term in term_frequencies(requests[i]["query"])
+                     if term in index.vocabulary]
+            statistics = relevance_statistics(index, terms, requests[i]["relevant"])
+            weights = bayesian_weights(statistics["r"], statistics["R"], statistics["n"],
+                                       statistics["N"], decimals=None)[requests[i]["weight"]]
+        except Exception as error:  # reported to this request's client only
+            results[i] = error
+            continue
+        weighted.append(i)
+        vectors.append(dict(zip(terms, weights.tolist())))
+    if weighted:
+        k = max(requests[i]["k"] for i in weighted)
+        batch = index.search_vectors(vectors, k, binary=True)
+        for i, top in zip(weighted, batch):
+            results[i] = top[:requests[i]["k"]]
+    return results
+
+
+class QueryServer:
+    """Serve an :class:`~tf_idf.index.InvertedIndex` on a local TCP port.
+
+    ``port=0`` picks a free port; :meth:`start` returns the bound port.
+    """
+
+    def __init__(self, index, host="127.0.0.1", port=0, batch_window=0.002, max_batch=256,
+                 max_pending=1024, workers=2, max_request_bytes=1 << 20):
+        self.index = index
+        self.host = host
+        self.port = port
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.workers = workers
+        self.max_request_bytes = max_request_bytes
+        self.batches = 0
+        self.requests = 0
+        self._server = None
+        self._queue = None
+        self._batcher = None
+        self._executor = None
+        self._in_flight = None
+        self._scoring = set()
+
+    async def start(self):
+        self._queue = asyncio.Queue(self.max_pending)
+        self._in_flight = asyncio.Semaphore(self.workers)
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="tf_idf-query")
+        self._batcher = asyncio.create_task(self._run_batches())
+        self._server = await asyncio.start_server(self._handle, self.host, self.port,
+                                                  limit=self.max_request_bytes)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self._batcher is not None:
+            self._batcher.cancel()
+            try:
+                await self._batcher
+            except asyncio.CancelledError:
+                pass
+            self._batcher = None
+        if self._scoring:
+            await asyncio.gather(*self._scoring, return_exceptions=True)
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _handle(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        responses = asyncio.Queue()
+        writing = asyncio.create_task(self._write_responses(writer, responses))
+        try:
+            async for line in _read_lines(reader):
+                if line is not None and not line.strip():
+                    continue
+                future = loop.create_future()
+                request_id = None
+                try:
+                    if line is None:
+                        raise ValueError(f"a request line is at most "
+                                         f"{self.max_request_bytes} bytes")
+                    request = parse_request(line)
+                    request_id = request.get("id")
+                except ValueError as error:
+                    future.set_result({"error": str(error)})
+                else:
+                    # Blocks reading this connection while the queue is full.
+                    await self._queue.put((request, future))
+                await responses.put((request_id, future))
+        except ConnectionError:
+            pass  # the client is gone; answer what was already read
+        finally:
+            await responses.put(None)
+            await writing
+            writer.close()
+
+    async def _write_responses(self, writer, responses):
+        while (item := await responses.get()) is not None:
+            request_id, future = item
+            response = await future
+            if request_id is not None:
+                response = {"id": request_id, **response}
+            writer.write(json.dumps(response).encode() + b"\n")
+            try:
+                await writer.drain()
+            except ConnectionError:
+                return
+
+    async def _run_batches(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._in_flight.acquire()
+            task = loop.create_task(self._score(batch))
+            self._scoring.add(task)
+            task.add_done_callback(self._scored)
+
+    def _scored(self, task):
+        self._scoring.discard(task)
+        self._in_flight.release()
+
+    async def _score(self, batch):
+        requests = [request for request, _ in batch]
+        self.batches += 1
+        self.requests += len(requests)
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self._executor, score_requests, self.index,
+                                                 requests)
+        except Exception as error:  # reported to every client of the batch
+            results = [error] * len(batch)
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_result({"error": f"{type(result).__name__}: {result}"})
+            else:
+                future.set_result({"results": [[doc_id, score] for doc_id, score in result]})
+
+
+async def _read_lines(reader):
+    """Lines of ``reader`` up to EOF; a line over the stream limit is skipped
+    and yielded as None."""
+    overlong = False
+    while True:
+        try:
+            line = await reader.readuntil(b"\n")
+        except asyncio.LimitOverrunError as error:
+            # Drop what was scanned and go on to the end of the line.
+            await reader.readexactly(error.consumed)
+            overlong = True
+            continue
+        except asyncio.IncompleteReadError as error:
+            line = error.partial
+        if overlong:
+            overlong = False
+            yield None
+        elif line:
+            yield line
+        if not line.endswith(b"\n"):
+            return
+
+
+def query(requests, port, host="127.0.0.1", timeout=30.0):
+    """Send request dicts over one connection and return the response dicts."""
+    with socket.create_connection((host, port), timeout=timeout) as connection:
+        connection.sendall(b"".join(json.dumps(r).encode() + b"\n" for r in requests))
+        with connection.makefile("rb") as responses:
+            return [json.loads(responses.readline()) for _ in requests]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("index", help="directory written by save_index or build_index")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--batch-window", type=float, default=0.002,
+                        help="seconds to wait for more requests before scoring a batch")
+    parser.add_argument("--max-batch", type=int, default=256)
+    parser.add_argument("--max-pending", type=int, default=1024)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--max-request-bytes", type=int, default=1 << 20,
+                        help="longest accepted request line")
+    args = parser.parse_args(argv)
+
+    server = QueryServer(load_index(args.index), args.host, args.port, args.batch_window,
+                         args.max_batch, args.max_pending, args.workers,
+                         args.max_request_bytes)
+
+    async def serve():
+        port = await server.start()
+        print(f"serving {args.index} on {args.host}:{port}", flush=True)
+        try:
+            await server.serve_forever()
+        finally:
+            await server.close()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,216 @@
+"""Document-partitioned shards searched by worker processes.
+
+:func:`build_shards` deals the documents of a stream round-robin over
+``n_shards`` builders and writes one on-disk index per shard (see
+:mod:`tf_idf.storage`) next to the collection's global statistics::
+
+    shards.json             manifest: format, version, document and shard counts
+    terms.npy, term_offsets.npy, term_ids.npy
+                            global vocabulary (see :class:`~tf_idf.storage.SortedVocabulary`)
+    df.npy, idf.npy         global document frequencies and idf
+    shard-000/, ...         one index per shard
+
+Every shard is weighted with the global idf, so a document has the same
+tf-idf weights as in an index of the whole collection. :class:`ShardedIndex`
+starts one process per shard that memory-maps its index and answers queries
+over a pipe. A query is weighted once with the global idf, sent to every
+shard, and the local top-``k`` lists are merged with a heap. Scores are
+summed in the same order as in a single index, and ties are broken by the
+document's position in the original stream, so the results are identical to
+:meth:`~tf_idf.index.InvertedIndex.search` on the whole collection.
+"""
+
+import heapq
+import json
+import os
+import threading
+from itertools import islice
+
+import numpy as np
+
+from tf_idf.ingest import IndexBuilder
+from tf_idf.statistics import IndexStatistics
+from tf_idf.storage import load_index, load_vocabulary, save_vocabulary
+
+FORMAT_NAME = "tf_idf-shards"
+FORMAT_VERSION = 1
+
+
+def _shard_name(shard):
+    return f"shard-{shard:03d}"
+
+
+def build_shards(documents, path, n_shards, memory_budget=64 << 20, run_dir=None):
+    """Index ``(doc_id, text)`` pairs into ``n_shards`` shards under ``path``.
+
+    Document ``i`` of the stream goes to shard ``i % n_shards``. Each shard
+    buffers at most ``memory_budget / n_shards`` bytes of postings before
+    spilling a run to disk. Returns the manifest written to ``shards.json``.
+    """
+    if n_shards < 1:
+        raise ValueError(f"n_shards must be at least 1, got {n_shards!r}")
+    builders = [IndexBuilder(memory_budget // n_shards,
+                             None if run_dir is None else os.path.join(run_dir,
+                                                                       _shard_name(shard)))
+                for shard in range(n_shards)]
+    for position, (doc_id, text) in enumerate(documents):
+        builders[position % n_shards].add(doc_id, text)
+
+    statistics = IndexStatistics()
+    global_ids = [statistics.merge(builder.statistics) for builder in builders]
+    idf = statistics.idf()
+
+    os.makedirs(path, exist_ok=True)
+    for shard, builder in enumerate(builders):
+        builder.finish(os.path.join(path, _shard_name(shard)), idf=idf[global_ids[shard]])
+
+    save_vocabulary(path, statistics.vocabulary)
+    np.save(os.path.join(path, "df.npy"), statistics.df)
+    np.save(os.path.join(path, "idf.npy"), idf)
+    manifest = {
+        "format": FORMAT_NAME,
+        "version": FORMAT_VERSION,
+        "n_documents": statistics.n_documents,
+        "n_terms": len(statistics),
+        "n_shards": n_shards,
+        "shards": [_shard_name(shard) for shard in range(n_shards)],
+    }
+    with open(os.path.join(path, "shards.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def serve_shard(path, shard, n_shards, connection):
+    """Worker loop: answer ``(query_weights, k)`` messages until ``None``.
+
+    Every hit is sent as ``(position, doc_id, score)``, where ``position``
+    is the document's position in the stream the shards were built from.
+    """
+    index = load_index(path)
+    while (message := connection.recv()) is not None:
+        queries, k = message
+        try:
+            if len(queries) == 1:
+                results = [index.search(queries[0], k, rows=True)]
+            else:
+                results = index.search_vectors(queries, k, rows=True)
+            reply = [[(row * n_shards + shard, index.doc_ids[row], score) for row, score in top]
+                     for top in results]
+        except Exception as error:  # re-raised by the coordinator
+            reply = error
+        connection.send(reply)
+    connection.close()
+
+
+class ShardedIndex:
+    """Scatter-gather search over the shards written by :func:`build_shards`.
+
+    Starts one worker process per shard; use it as a context manager or call
+    :meth:`close` to stop them. Calls may come from several threads, and are
+    answered one at a time.
+    """
+
+    def __init__(self, path, mp_context=None):
+        manifest_path = os.path.join(path, "shards.json")
+        if not os.path.exists(manifest_path):
+            raise FileNotFoundError(f"No sharded index found at {path!r}")
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("format") != FORMAT_NAME:
+            raise ValueError(f"{path!r} is not a {FORMAT_NAME} directory")
+        if manifest.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported shards format version {manifest.get('version')!r}, "
+                             f"expected {FORMAT_VERSION}")
+
+        self.vocabulary = load_vocabulary(path)
+        self.df = np.load(os.path.join(path, "df.npy"), mmap_mode="r")
+        self.idf = np.load(os.path.join(path, "idf.npy"), mmap_mode="r")
+        self._n_documents = manifest["n_documents"]
+        self._lock = threading.Lock()
+
+        import multiprocessing
+
+        context = mp_context or multiprocessing.get_context()
+        self._connections = []
+        self._workers = []
+        n_shards = manifest["n_shards"]
+        for shard, name in enumerate(manifest["shards"]):
+            connection, worker_connection = context.Pipe()
+            worker = context.Process(target=serve_shard, name=f"tf_idf-{name}", daemon=True,
+                                     args=(os.path.join(path, name), shard, n_shards,
+                                           worker_connection))
+            worker.start()
+            worker_connection.close()
+            self._connections.append(connection)
+            self._workers.append(worker)
+
+    def __len__(self):
+        return self._n_documents
+
+    @property
+    def n_documents(self):
+        return self._n_documents
+
+    @property
+    def n_shards(self):
+        return len(self._workers)
+
+    def document_frequency(self, term):
+        term_id = self.vocabulary.get(term)
+        return 0 if term_id is None else int(self.df[term_id])
+
+    def weigh_query(self, term_counts):
+        """Turn query term counts into ``{term: tf * idf}`` with the global idf."""
+        return {term: count * self.idf[self.vocabulary[term]]
+                for term, count in term_counts.items()
+                if term in self.vocabulary}
+
+    def search(self, query_weights, k=10):
+        """Top-``k`` documents of all shards as ``[(doc_id, score), ...]``."""
+        return self._scatter([query_weights], k)[0]
+
+    def search_batch(self, queries, k=10):
+        """Top-``k`` documents for every ``{term: count}`` query in ``queries``.
+
+        The whole batch is sent to every shard in one message.
+        """
+        return self._scatter([self.weigh_query(query) for query in queries], k)
+
+    def _scatter(self, queries, k):
+        if k <= 0 or not queries:
+            return [[] for _ in queries]
+        if not self._connections:
+            raise ValueError("the sharded index is closed")
+        with self._lock:
+            for connection in self._connections:
+                connection.send((queries, k))
+            replies = [connection.recv() for connection in self._connections]
+        for reply in replies:
+            if isinstance(reply, Exception):
+                raise reply
+
+        results = []
+        for q in range(len(queries)):
+            # Each shard's list is ordered by (-score, position) already.
+            merged = heapq.merge(*(reply[q] for reply in replies),
+                                 key=lambda hit: (-hit[2], hit[0]))
+            results.append([(doc_id, score) for _, doc_id, score in islice(merged, k)])
+        return results
+
+    def close(self):
+        for connection in self._connections:
+            try:
+                connection.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            connection.close()
+        for worker in self._workers:
+            worker.join()
+        self._connections = []
+        self._workers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,305 @@
+"""All-pairs document similarity for near-duplicate detection.
+
+Every pair of documents whose cosine similarity (or, with
+``normalize=False``, tf-idf inner product) reaches ``threshold`` is found
+without forming the N x N product, following the AllPairs algorithm of
+Bayardo, Ma and Srikant:
+
+* Terms are ordered by decreasing document frequency. The leading terms of
+  a document whose summed upper bound ``w * max_weight(term)`` stays below
+  the threshold form its prefix. Two documents can only reach the
+  threshold if they share a term outside the prefix of one of them, so
+  only these suffix postings are scanned to generate candidate pairs, and
+  the long postings of frequent terms mostly stay out of the scan.
+* Candidates whose partial score plus the prefix bound of their partner is
+  below the threshold are dropped; the prefix contributions of the others
+  are added by looking the prefix terms up in the probing documents.
+
+Documents are probed in blocks of rows sized so that at most
+``memory_budget`` bytes of partial products are alive at a time, and the
+blocks can be scored by a process pool. Run it from the repository root::
+
+    python -m tf_idf.similarity corpus.index --threshold 0.9 --workers 8 > pairs.tsv
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+from collections import deque
+
+import numpy as np
+
+from tf_idf.index import _segment_max
+
+# int64 pair key and accumulator slot, int64 posting position and float64
+# contribution for every generated partial product.
+PRODUCT_BYTES = 32
+
+_ARRAYS = ("doc_ptr", "f_terms", "f_weights", "p_ptr", "p_terms", "p_weights", "s_ptr",
+           "s_keys", "s_weights", "prefix_bound", "prefix_norms", "doc_norms")
+
+_worker_arrays = None
+
+
+def _slack(value):
+    return 1e-9 * np.abs(value) + 1e-12
+
+
+def _segment_cumsum(values, lengths):
+    """Running sums restarting at every segment, and their rounding error bound."""
+    cumulative = np.cumsum(values)
+    before = np.concatenate([[0.0], cumulative])[np.cumsum(lengths) - lengths]
+    # The running sums of a segment share the rounding error of everything
+    # before it, so only the segment's own additions can move the result.
+    error = (np.repeat(lengths, lengths) + 2) * np.finfo(np.float64).eps * np.abs(cumulative)
+    return cumulative - np.repeat(before, lengths), error
+
+
+def prepare(index, threshold, normalize=True):
+    """Arrays of the AllPairs search over ``index`` for ``threshold``.
+
+    ``f_*`` is the forward (document -> term) view of the weights, ``p_*``
+    the same for the prefix terms only and ``s_*`` the term -> postings
+    view of the suffix terms, keyed by ``term * n_docs + row``. What a
+    document's prefix adds to a score is at most ``prefix_bound`` and at
+    most ``prefix_norms`` times the norm of the other document.
+    """
+    if not threshold > 0:
+        raise ValueError(f"threshold must be positive, got {threshold!r}")
+    n_docs = index.n_documents
+    term_ptr = np.asarray(index.term_ptr, dtype=np.int64)
+    n_terms = len(term_ptr) - 1
+    doc_rows = np.asarray(index.doc_rows, dtype=np.int32)
+    weights = np.asarray(index.weights, dtype=np.float64)
+    doc_norms = np.asarray(index.doc_norms, dtype=np.float64)
+    if normalize:
+        scale = np.divide(1.0, doc_norms, out=np.zeros_like(doc_norms), where=doc_norms > 0)
+        weights = weights * scale[doc_rows]
+        doc_norms = (doc_norms > 0).astype(np.float64)
+    df = np.diff(term_ptr)
+    term_of = np.repeat(np.arange(n_terms, dtype=np.int64), df)
+    max_weights = _segment_max(weights, term_ptr)
+    max_norm = float(doc_norms.max()) if n_docs else 0.0
+
+    doc_ptr = np.zeros(n_docs + 1, dtype=np.int64)
+    np.cumsum(np.bincount(doc_rows, minlength=n_docs), out=doc_ptr[1:])
+    doc_lengths = np.diff(doc_ptr)
+
+    # Frequent terms first, so they end up in the unindexed prefixes. A term
+    # is in the prefix while both the max-weight bound and the Cauchy-Schwarz
+    # bound of the prefix dot product stay below the threshold.
+    rank = np.empty(n_terms, dtype=np.int64)
+    rank[np.lexsort((np.arange(n_terms), -df))] = np.arange(n_terms)
+    by_rank = np.lexsort((rank[term_of], doc_rows))
+    ranked = weights[by_rank]
+    bounds = ranked * max_weights[term_of[by_rank]]
+    bound, bound_error = _segment_cumsum(bounds, doc_lengths)
+    squares, squares_error = _segment_cumsum(ranked * ranked, doc_lengths)
+    norm_bound = np.sqrt(squares + squares_error) * max_norm
+    limit = threshold - _slack(threshold)
+    in_prefix = (bound + bound_error < limit) | (norm_bound * (1 + 1e-12) < limit)
+    prefix_docs = doc_rows[by_rank][in_prefix]
+    prefix_bound = np.bincount(prefix_docs, weights=bounds[in_prefix], minlength=n_docs)
+    prefix_norms = np.sqrt(np.bincount(prefix_docs, weights=ranked[in_prefix] ** 2,
+                                       minlength=n_docs))
+
+    indexed = np.ones(len(weights), dtype=bool)
+    indexed[by_rank[in_prefix]] = False
+    s_ptr = np.zeros(n_terms + 1, dtype=np.int64)
+    np.cumsum(np.bincount(term_of[indexed], minlength=n_terms), out=s_ptr[1:])
+
+    forward = np.argsort(doc_rows, kind="stable")
+    prefix = ~indexed[forward]
+    p_ptr = np.zeros(n_docs + 1, dtype=np.int64)
+    np.cumsum(np.bincount(doc_rows[forward][prefix], minlength=n_docs), out=p_ptr[1:])
+    return {
+        "doc_ptr": doc_ptr,
+        "f_terms": term_of[forward],
+        "f_weights": weights[forward],
+        "p_ptr": p_ptr,
+        "p_terms": term_of[forward][prefix],
+        "p_weights": weights[forward][prefix],
+        "s_ptr": s_ptr,
+        "s_keys": term_of[indexed] * n_docs + doc_rows[indexed],
+        "s_weights": weights[indexed],
+        "prefix_bound": prefix_bound,
+        "prefix_norms": prefix_norms,
+        "doc_norms": doc_norms,
+    }
+
+
+def _expand(starts, lengths):
+    owner = np.repeat(np.arange(len(starts)), lengths)
+    offsets = np.arange(len(owner)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return owner, starts[owner] + offsets
+
+
+def _chunks(lengths, max_products):
+    """Slices of ``lengths`` summing to about ``max_products`` each."""
+    cumulative = np.cumsum(lengths)
+    start = 0
+    while start < len(lengths):
+        done = cumulative[start - 1] if start else 0
+        end = max(int(np.searchsorted(cumulative, done + max_products, side="right")),
+                  start + 1)
+        yield slice(start, end)
+        start = end
+
+
+def _later_postings(arrays, terms, rows):
+    """First suffix posting of every term after the given row, and the term's end."""
+    n_docs = len(arrays["doc_ptr"]) - 1
+    starts = np.searchsorted(arrays["s_keys"], terms * n_docs + rows, side="right")
+    return starts, arrays["s_ptr"][terms + 1]
+
+
+def score_block(arrays, start, end, threshold, max_products=1 << 23):
+    """Every pair with ``start <= row_a < end`` and ``row_a < row_b`` scoring
+    at least ``threshold``, as ``row_a``, ``row_b`` and score arrays sorted by
+    ``(row_a, row_b)``. The prefix lookups are done ``max_products`` at a time.
+    """
+    doc_ptr = arrays["doc_ptr"]
+    n_docs, n_terms = len(doc_ptr) - 1, len(arrays["s_ptr"]) - 1
+    lo, hi = doc_ptr[start], doc_ptr[end]
+    terms = np.asarray(arrays["f_terms"][lo:hi], dtype=np.int64)
+    weights = np.asarray(arrays["f_weights"][lo:hi])
+    owners = np.repeat(np.arange(start, end, dtype=np.int64), np.diff(doc_ptr[start:end + 1]))
+
+    # Candidates: probe the suffix postings of later documents.
+    first, last = _later_postings(arrays, terms, owners)
+    entry, positions = _expand(first, last - first)
+    keys = (owners[entry] - start) * n_docs + arrays["s_keys"][positions] % n_docs
+    pairs, accumulator = np.unique(keys, return_inverse=True)
+    scores = np.bincount(accumulator, weights=weights[entry] * arrays["s_weights"][positions],
+                         minlength=len(pairs))
+    del keys, accumulator, entry, positions
+    rows_a, rows_b = np.divmod(pairs, n_docs)
+    rows_a += start
+
+    prefix_bound = np.minimum(arrays["prefix_bound"][rows_b],
+                              arrays["prefix_norms"][rows_b] * arrays["doc_norms"][rows_a])
+    reachable = scores + prefix_bound >= threshold - _slack(threshold)
+    rows_a, rows_b, scores = rows_a[reachable], rows_b[reachable], scores[reachable]
+
+    # Add the prefix terms of row_b that row_a contains as well.
+    p_ptr, p_terms, p_weights = arrays["p_ptr"], arrays["p_terms"], arrays["p_weights"]
+    block_keys = (owners - start) * n_terms + terms
+    lengths = p_ptr[rows_b + 1] - p_ptr[rows_b]
+    if len(block_keys):
+        for chunk in _chunks(lengths, max_products):
+            candidate, prefix_positions = _expand(p_ptr[rows_b[chunk]], lengths[chunk])
+            wanted = ((rows_a[chunk][candidate] - start) * n_terms
+                      + np.asarray(p_terms[prefix_positions], dtype=np.int64))
+            found_at = np.minimum(np.searchsorted(block_keys, wanted), len(block_keys) - 1)
+            found = block_keys[found_at] == wanted
+            scores[chunk] += np.bincount(
+                candidate[found],
+                weights=weights[found_at[found]] * p_weights[prefix_positions[found]],
+                minlength=chunk.stop - chunk.start)
+
+    similar = scores >= threshold
+    return rows_a[similar], rows_b[similar], scores[similar]
+
+
+def _blocks(arrays, max_products, max_rows):
+    """Row ranges of at most ``max_rows`` rows whose candidate generation
+    scans about ``max_products`` postings."""
+    doc_ptr = arrays["doc_ptr"]
+    n_docs = len(doc_ptr) - 1
+    owners = np.repeat(np.arange(n_docs), np.diff(doc_ptr))
+    first, last = _later_postings(arrays, np.asarray(arrays["f_terms"], dtype=np.int64), owners)
+    cost = np.bincount(owners, weights=last - first, minlength=n_docs)
+    for rows in _chunks(cost, max_products):
+        for start in range(rows.start, rows.stop, max_rows):
+            yield start, min(start + max_rows, rows.stop)
+
+
+def _load_arrays(directory):
+    global _worker_arrays
+    _worker_arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+                      for name in _ARRAYS}
+
+
+def _score_block_in_worker(start, end, threshold, max_products):
+    return score_block(_worker_arrays, start, end, threshold, max_products)
+
+
+def all_pairs(index, threshold=0.9, memory_budget=256 << 20, workers=1, normalize=True):
+    """Yield ``(doc_a, doc_b, score)`` for every pair scoring at least ``threshold``.
+
+    ``index`` is an :class:`~tf_idf.index.InvertedIndex`. Scores are cosine
+    similarities of the tf-idf vectors, or inner products with
+    ``normalize=False``. Every pair is reported once, ordered by the rows
+    of ``doc_a`` and then ``doc_b`` with ``doc_a`` before ``doc_b`` in the
+    index. With ``workers > 1`` the blocks are scored by a process pool
+    that memory-maps the prepared arrays from a temporary directory; at
+    most ``2 * workers`` blocks are in flight.
+    """
+    arrays = prepare(index, threshold, normalize)
+    max_products = max(memory_budget // PRODUCT_BYTES, 1)
+    # Several blocks per worker, so the pool stays busy.
+    max_rows = max(-(-index.n_documents // (4 * workers)), 1)
+    blocks = list(_blocks(arrays, max_products, max_rows))
+    doc_ids = index.doc_ids
+    if workers <= 1:
+        for start, end in blocks:
+            yield from _labelled(doc_ids, *score_block(arrays, start, end, threshold,
+                                                       max_products))
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    directory = tempfile.mkdtemp(prefix="tf_idf-pairs-")
+    try:
+        for name in _ARRAYS:
+            np.save(os.path.join(directory, f"{name}.npy"), arrays[name])
+        del arrays
+        with ProcessPoolExecutor(max_workers=workers, initializer=_load_arrays,
+                                 initargs=(directory,)) as executor:
+            pending = deque()
+            for start, end in blocks:
+                pending.append(executor.submit(_score_block_in_worker, start, end, threshold,
+                                               max_products))
+                if len(pending) >= 2 * workers:
+                    yield from _labelled(doc_ids, *pending.popleft().result())
+            while pending:
+                yield from _labelled(doc_ids, *pending.popleft().result())
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def _labelled(doc_ids, rows_a, rows_b, scores):
+    for row_a, row_b, score in zip(rows_a.tolist(), rows_b.tolist(), scores.tolist()):
+        yield doc_ids[row_a], doc_ids[row_b], score
+
+
+def main(argv=None):
+    from tf_idf.storage import load_index
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("index", help="directory written by save_index or build_index")
+    parser.add_argument("--threshold", type=float, default=0.9)
+    parser.add_argument("--memory-budget", type=int, default=256,
+                        help="megabytes of partial products per block")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--inner-product", action="store_true",
+                        help="score with the tf-idf inner product instead of the cosine")
+    parser.add_argument("--output", help="TSV file to write, standard output by default")
+    args = parser.parse_args(argv)
+
+    pairs = all_pairs(load_index(args.index), args.threshold, args.memory_budget << 20,
+                      args.workers, normalize=not args.inner_product)
+    output = sys.stdout if args.output is None else open(args.output, "w", encoding="utf-8")
+    try:
+        for doc_a, doc_b, score in pairs:
+            output.write(f"{doc_a}\t{doc_b}\t{score:.6f}\n")
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
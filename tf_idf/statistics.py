@@ -0,0 +1,130 @@
+"""Corpus statistics: document count, document frequencies and idf."""
+
+from itertools import compress, repeat
+
+import numpy as np
+
+
+class IndexStatistics:
+    """Keeps ``N`` and the per-term document frequency up to date.
+
+    Terms get ids in first-seen order. ``idf()`` returns
+    ``log10(N / df)`` indexed by term id; it is cached and, between calls,
+    only the entries whose document frequency changed are recomputed. When
+    ``N`` changes the cached ``log10(df)`` values are reused and the vector
+    is rebuilt with a single subtraction. Terms with ``df == 0`` get idf 0.
+    """
+
+    def __init__(self):
+        self.vocabulary = {}
+        self.n_documents = 0
+        self._df = np.zeros(16, dtype=np.int64)
+        self._log_df = np.zeros(16, dtype=np.float64)
+        self._changed = set()
+        self._merged = []
+        self._idf = np.zeros(0, dtype=np.float64)
+        self._idf_n_documents = None
+
+    def __len__(self):
+        return len(self.vocabulary)
+
+    @property
+    def df(self):
+        return self._df[:len(self.vocabulary)]
+
+    def term_id(self, term):
+        term_id = self.vocabulary.get(term)
+        if term_id is None:
+            term_id = self.vocabulary[term] = len(self.vocabulary)
+            if term_id == len(self._df):
+                self._reserve(term_id + 1)
+        return term_id
+
+    def term_ids(self, terms):
+        """Ids of the distinct ``terms``, adding the unknown ones in order.
+
+        The lookups and insertions run in C (``map`` over ``dict.get`` and
+        ``dict.update``), not term by term in Python.
+        """
+        vocabulary = self.vocabulary
+        term_ids = np.array(list(map(vocabulary.get, terms, repeat(-1))), dtype=np.int64)
+        new = term_ids < 0
+        n_new = int(new.sum())
+        if n_new:
+            start = len(vocabulary)
+            term_ids[new] = np.arange(start, start + n_new)
+            vocabulary.update(zip(compress(terms, new.tolist()), range(start, start + n_new)))
+            self._reserve(len(vocabulary))
+        return term_ids
+
+    def _reserve(self, n_terms):
+        capacity = len(self._df)
+        while capacity < n_terms:
+            capacity *= 2
+        if capacity > len(self._df):
+            grow = capacity - len(self._df)
+            self._df = np.concatenate([self._df, np.zeros(grow, dtype=np.int64)])
+            self._log_df = np.concatenate([self._log_df, np.zeros(grow, dtype=np.float64)])
+
+    def document_frequency(self, term):
+        term_id = self.vocabulary.get(term)
+        return 0 if term_id is None else int(self._df[term_id])
+
+    def add_document(self, terms):
+        """Count one document containing ``terms`` (any iterable of terms)."""
+        term_ids = [self.term_id(term) for term in set(terms)]
+        self._df[term_ids] += 1
+        self._changed.update(term_ids)
+        self.n_documents += 1
+        return term_ids
+
+    def remove_document(self, terms):
+        """Undo :meth:`add_document` for a document containing ``terms``."""
+        self.remove_term_ids([self.vocabulary[term] for term in set(terms)])
+
+    def remove_term_ids(self, term_ids):
+        """Like :meth:`remove_document`, for a document's distinct term ids."""
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        self._df[term_ids] -= 1
+        self._changed.update(term_ids.tolist())
+        self.n_documents -= 1
+
+    def merge(self, other):
+        """Add the counts of another :class:`IndexStatistics`.
+
+        Returns the ids, in this vocabulary, of the terms of ``other``.
+        """
+        return self.merge_counts(list(other.vocabulary), other.df, other.n_documents)
+
+    def merge_counts(self, terms, df, n_documents):
+        """Add ``n_documents`` documents in which the distinct ``terms`` have ``df``.
+
+        Returns the ids of ``terms``.
+        """
+        term_ids = self.term_ids(terms)
+        self._df[term_ids] += np.asarray(df, dtype=np.int64)
+        self._merged.append(term_ids)
+        self.n_documents += n_documents
+        return term_ids
+
+    def idf(self):
+        n_terms = len(self.vocabulary)
+        if self._changed or self._merged:
+            term_ids = np.concatenate([np.fromiter(self._changed, dtype=np.int64,
+                                                   count=len(self._changed)), *self._merged])
+            self._changed.clear()
+            self._merged = []
+            self._log_df[term_ids] = np.log10(np.maximum(self._df[term_ids], 1))
+        else:
+            term_ids = None
+
+        if self._idf_n_documents != self.n_documents or len(self._idf) != n_terms:
+            log_n = np.log10(self.n_documents) if self.n_documents else 0.0
+            self._idf = log_n - self._log_df[:n_terms]
+            self._idf[self._df[:n_terms] == 0] = 0.0
+            self._idf_n_documents = self.n_documents
+        elif term_ids is not None:
+            log_n = np.log10(self.n_documents) if self.n_documents else 0.0
+            self._idf[term_ids] = np.where(self._df[term_ids] > 0,
+                                           log_n - self._log_df[term_ids], 0.0)
+        return self._idf.copy()
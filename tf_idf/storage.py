@@ -0,0 +1,265 @@
+"""Versioned on-disk index format with memory-mapped loading.
+
+An index is a directory holding:
+
+``meta.json``
+    Format name and version plus the document, term and posting counts.
+``terms.npy``, ``term_offsets.npy``, ``term_ids.npy``
+    The vocabulary: the sorted terms as one UTF-8 byte array, the offset of
+    each term in it and the id of each term.
+``doc_ids.npy`` or ``doc_ids.json``
+    The external document ids in row order; integer ids are stored as an
+    ``int64`` array, any other ids as a JSON list.
+``<name>.npy``
+    ``term_ptr``, ``doc_rows``, ``weights``, ``df``, ``idf``, ``max_weights``
+    and ``doc_norms`` as plain ``.npy`` arrays.
+
+:func:`load_index` opens the arrays with ``numpy.load(mmap_mode="r")``, so
+loading does not read the postings, and several processes that load the
+same index share the page cache. Terms are looked up by binary search in
+the memory-mapped vocabulary (see :class:`SortedVocabulary`), so no
+per-term or per-document Python objects are built before the first query.
+"""
+
+import json
+import os
+from bisect import bisect_right
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+
+from tf_idf.index import InvertedIndex, _doc_norms, _segment_max
+
+FORMAT_NAME = "tf_idf-index"
+FORMAT_VERSION = 1
+ARRAY_DTYPES = {
+    "term_ptr": np.int64,
+    "doc_rows": np.int32,
+    "weights": np.float64,
+    "df": np.int64,
+    "idf": np.float64,
+    "max_weights": np.float64,
+    "doc_norms": np.float64,
+}
+
+
+class SortedVocabulary(Mapping):
+    """Read-only term -> id mapping over sorted, UTF-8 encoded terms.
+
+    ``blob`` is a ``uint8`` array of the encoded terms back to back, term
+    ``i`` being ``blob[offsets[i]:offsets[i + 1]]``, and ``term_ids[i]`` is
+    its id. UTF-8 byte order is code-point order, so the terms are sorted as
+    strings. A lookup bisects every ``stride``-th term, read into memory on
+    the first lookup, then binary-searches one stretch of ``stride`` terms.
+    Iteration is in term order.
+    """
+
+    stride = 1024
+
+    def __init__(self, blob, offsets, term_ids):
+        # Plain ndarray views of memory maps: slicing a memmap is slower.
+        self.blob = np.asarray(blob)
+        self.offsets = np.asarray(offsets)
+        self.term_ids = np.asarray(term_ids)
+        self._sample = None
+
+    @classmethod
+    def from_mapping(cls, vocabulary):
+        if isinstance(vocabulary, cls):
+            return vocabulary
+        encoded = [term.encode("utf-8") for term in vocabulary]
+        term_ids = np.fromiter(vocabulary.values(), dtype=np.int64, count=len(encoded))
+        order = sorted(range(len(encoded)), key=encoded.__getitem__)
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(encoded[i]) for i in order], out=offsets[1:])
+        blob = np.frombuffer(b"".join([encoded[i] for i in order]), dtype=np.uint8)
+        return cls(blob, offsets, term_ids[np.array(order, dtype=np.int64)])
+
+    def _term(self, i):
+        return self.blob[self.offsets.item(i):self.offsets.item(i + 1)].tobytes()
+
+    def _find(self, term):
+        """Id of ``term``, or None."""
+        if not isinstance(term, str):
+            return None
+        if self._sample is None:
+            self._sample = [self._term(i) for i in range(0, len(self), self.stride)]
+        key = term.encode("utf-8")
+        lo = (bisect_right(self._sample, key) - 1) * self.stride
+        if lo < 0:
+            return None
+        hi = min(lo + self.stride, len(self))
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == len(self) or self._term(lo) != key:
+            return None
+        return self.term_ids.item(lo)
+
+    def __getitem__(self, term):
+        term_id = self._find(term)
+        if term_id is None:
+            raise KeyError(term)
+        return term_id
+
+    def get(self, term, default=None):
+        term_id = self._find(term)
+        return default if term_id is None else term_id
+
+    def __contains__(self, term):
+        return self._find(term) is not None
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __iter__(self):
+        terms = self.blob.tobytes()
+        offsets = self.offsets.tolist()
+        return (terms[start:end].decode("utf-8") for start, end in zip(offsets, offsets[1:]))
+
+    def items(self):
+        return zip(self, self.term_ids.tolist())
+
+
+def save_vocabulary(path, vocabulary):
+    """Write a term -> id mapping as the ``terms``, ``term_offsets`` and
+    ``term_ids`` arrays of :class:`SortedVocabulary` under ``path``."""
+    sorted_vocabulary = SortedVocabulary.from_mapping(vocabulary)
+    np.save(os.path.join(path, "terms.npy"), np.asarray(sorted_vocabulary.blob, dtype=np.uint8))
+    np.save(os.path.join(path, "term_offsets.npy"),
+            np.asarray(sorted_vocabulary.offsets, dtype=np.int64))
+    np.save(os.path.join(path, "term_ids.npy"),
+            np.asarray(sorted_vocabulary.term_ids, dtype=np.int64))
+
+
+def load_vocabulary(path, mmap=True):
+    """The :class:`SortedVocabulary` written by :func:`save_vocabulary`."""
+    mmap_mode = "r" if mmap else None
+    return SortedVocabulary(*(np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+                              for name in ("terms", "term_offsets", "term_ids")))
+
+
+class IntegerDocIds(Sequence):
+    """Document ids stored as an ``int64`` array, returned as Python ints."""
+
+    def __init__(self, ids):
+        self.ids = ids
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return self.ids[row].tolist()
+        return int(self.ids[row])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.ids.tolist())
+
+
+def _integer_ids(doc_ids):
+    """``doc_ids`` as an ``int64`` array, or None unless all are integers."""
+    if isinstance(doc_ids, IntegerDocIds):
+        return doc_ids.ids
+    if not all(type(doc_id) is int for doc_id in doc_ids):
+        return None
+    try:
+        return np.array(doc_ids, dtype=np.int64)
+    except OverflowError:
+        return None
+
+
+def create_array(path, name, length):
+    """Writable memory-mapped ``.npy`` array of the format for ``name``."""
+    os.makedirs(path, exist_ok=True)
+    return np.lib.format.open_memmap(os.path.join(path, f"{name}.npy"), mode="w+",
+                                     dtype=ARRAY_DTYPES[name], shape=(int(length),))
+
+
+def write_index(path, vocabulary, doc_ids, term_ptr, doc_rows, weights, idf):
+    """Write an index whose ``doc_rows`` and ``weights`` may already be in ``path``.
+
+    Arrays created with :func:`create_array` are flushed in place, anything
+    else is written out. ``meta.json`` is written last, so a directory
+    without it is an incomplete index.
+    """
+    os.makedirs(path, exist_ok=True)
+    arrays = {
+        "term_ptr": term_ptr,
+        "doc_rows": doc_rows,
+        "weights": weights,
+        "df": np.diff(term_ptr),
+        "idf": np.zeros(len(vocabulary)) if idf is None else idf,
+        "max_weights": _segment_max(weights, term_ptr),
+        "doc_norms": _doc_norms(doc_rows, weights, len(doc_ids)),
+    }
+    for name, array in arrays.items():
+        file_name = os.path.join(path, f"{name}.npy")
+        if isinstance(array, np.memmap) and os.path.abspath(array.filename) == os.path.abspath(file_name):
+            array.flush()
+        else:
+            np.save(file_name, np.asarray(array, dtype=ARRAY_DTYPES[name]))
+
+    save_vocabulary(path, vocabulary)
+    integer_ids = _integer_ids(doc_ids)
+    if integer_ids is not None:
+        np.save(os.path.join(path, "doc_ids.npy"), integer_ids)
+    else:
+        with open(os.path.join(path, "doc_ids.json"), "w", encoding="utf-8") as f:
+            json.dump(list(doc_ids), f)
+    with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "format": FORMAT_NAME,
+            "version": FORMAT_VERSION,
+            "n_documents": len(doc_ids),
+            "n_terms": len(vocabulary),
+            "n_postings": int(term_ptr[-1]),
+            "has_idf": idf is not None,
+            "integer_doc_ids": integer_ids is not None,
+        }, f, indent=2)
+
+
+def save_index(index, path):
+    """Save an :class:`~tf_idf.index.InvertedIndex` to the directory ``path``."""
+    write_index(path, index.vocabulary, index.doc_ids, index.term_ptr, index.doc_rows,
+                index.weights, index.idf)
+
+
+def load_index(path, mmap=True):
+    """Load an index saved with :func:`save_index`.
+
+    With ``mmap=True`` the arrays are read-only memory maps; pass
+    ``mmap=False`` to read them into memory.
+    """
+    meta_path = os.path.join(path, "meta.json")
+    if not os.path.exists(meta_path):
+        raise FileNotFoundError(f"No index found at {path!r}")
+    with open(meta_path, encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("format") != FORMAT_NAME:
+        raise ValueError(f"{path!r} is not a {FORMAT_NAME} directory")
+    if meta.get("version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported index format version {meta.get('version')!r}, "
+                         f"expected {FORMAT_VERSION}")
+
+    mmap_mode = "r" if mmap else None
+    arrays = {}
+    for name in ARRAY_DTYPES:
+        arrays[name] = np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+
+    vocabulary = load_vocabulary(path, mmap)
+    if meta.get("integer_doc_ids"):
+        doc_ids = IntegerDocIds(np.load(os.path.join(path, "doc_ids.npy"),
+                                        mmap_mode=mmap_mode))
+    else:
+        with open(os.path.join(path, "doc_ids.json"), encoding="utf-8") as f:
+            doc_ids = json.load(f)
+
+    return InvertedIndex.from_postings(
+        vocabulary, doc_ids,
+        arrays["term_ptr"], arrays["doc_rows"], arrays["weights"],
+        arrays["idf"] if meta["has_idf"] else None,
+        max_weights=arrays["max_weights"], doc_norms=arrays["doc_norms"])
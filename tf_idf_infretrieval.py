@@ -79,181 +79,192 @@ query = "gold silver truck"
 ## **Importing Libraries**
 """
 
-from sklearn.feature_extraction.text import TfidfVectorizer
-import math
-import pandas as pd
+from tf_idf import Analyzer, InvertedIndex, SegmentedIndex, build_term_matrix, term_frequencies, tokenize
 
 """## **Building Unique Words List Using TF-IDF Vectorization**
 
 The **TfidfVectorizer** is a component of the scikit-learn library used for text analysis and natural language processing. *TF-IDF* stands for *Term Frequency-Inverse Document Frequency* which is a numerical statistic that reflects the importance of a word within a document relative to a collection of documents (corpus).
 
+We tokenize the same way the TfidfVectorizer does by default: the text is lowercased and every run of two or more word characters is a word. Each document is tokenized only once.
+
 ### Creating Funtions for DRY
 """
 
 def get_unique_words(sentence):
-    sentence = sentence.lower()
-    vectorizer = TfidfVectorizer()
-    tfidf_matrix = vectorizer.fit_transform([sentence])
-    unique_words = vectorizer.get_feature_names_out()
-    return unique_words
+    return sorted(set(tokenize(sentence)))
 
 def get_words(sentence):
-    sentence = sentence.lower()
-    words = sentence.split()
-    return words
+    return tokenize(sentence)
 
 def calculate_word_frequencies(document):
-    words = get_words(document)
-    word_frequencies = {word: words.count(word) for word in words}
-    return word_frequencies
+    return dict(term_frequencies(document))
 
 def create_word_frequencies_df(unique_words, word_frequencies_dict):
-    df = pd.DataFrame(index=word_frequencies_dict.keys(), columns=unique_words)
+    vocabulary = {word: i for i, word in enumerate(unique_words)}
+    return build_term_matrix(word_frequencies_dict, vocabulary).to_dataframe()
 
-    for index, row in df.iterrows():
-        document_name = index
-        word_frequencies = word_frequencies_dict.get(document_name, {})
+def main():
+    """Run the example of the notebook."""
+    import pandas as pd
 
-        for column in df.columns:
-            if column in word_frequencies:
-                row[column] = word_frequencies[column]
-            else:
-                row[column] = 0
+    d_1 = "shipment of gold damaged in a fire"
+    d_2 = "delivery of silver arrived in a silver truck"
+    d_3 = "shipment of gold arrived in a truck"
+    query = "gold silver truck"
+    # Add more documents here as needed!
 
-    df = df.fillna(0)
+    d_1_unique = get_unique_words(d_1)
+    d_2_unique = get_unique_words(d_2)
+    d_3_unique = get_unique_words(d_3)
+    query_unique = get_unique_words(query)
+    # Add more documents here as needed!
 
-    return df
+    print(query_unique)
 
-d_1 = "shipment of gold damaged in a fire"
-d_2 = "delivery of silver arrived in a silver truck"
-d_3 = "shipment of gold arrived in a truck"
-query = "gold silver truck"
-# Add more documents here as needed!
+    print(d_1_unique)
 
-d_1_unique = get_unique_words(d_1)
-d_2_unique = get_unique_words(d_2)
-d_3_unique = get_unique_words(d_3)
-query_unique = get_unique_words(query)
-# Add more documents here as needed!
+    print(d_2_unique)
 
-query_unique
+    print(d_3_unique)
 
-d_1_unique
+    """## **Calculating Frequency and Log Frequency of the Unique Words**
 
-d_2_unique
+    $$D_i = <d_{i1}, d_{i2}, ..., d_{in}> $$
 
-d_3_unique
+    <br>
 
-"""## **Calculating Frequency and Log Frequency of the Unique Words**
+    $$Q = <w_{q1}, w_{q2}, ..., w_{qn}> $$
 
-$$D_i = <d_{i1}, d_{i2}, ..., d_{in}> $$
+    <br>
 
-<br>
+    In this process, we start by alphabetically listing all words present in the documents. We then calculate the frequency of each word within the documents. Next, we calculate word weights based on a logarithmic transformation using a base of 10, achieved by dividing the number of documents $N$ by the word frequency values.
 
-$$Q = <w_{q1}, w_{q2}, ..., w_{qn}> $$
+    $$ \log_{10}(\frac{N}{frequency}) $$
 
-<br>
+    The index statistics keep $N$ and the frequency of every word up to date as documents are added, and compute the whole idf vector in one step.
 
-In this process, we start by alphabetically listing all words present in the documents. We then calculate the frequency of each word within the documents. Next, we calculate word weights based on a logarithmic transformation using a base of 10, achieved by dividing the number of documents by the word frequency values.
+    <br>
+    """
 
-$$ \log_{10}(\frac{3}{frequency}) $$
+    documents = {
+        "d_1_unique": d_1,
+        "d_2_unique": d_2,
+        "d_3_unique": d_3,
+        # Add more documents here as needed!
+    }
 
-<br>
-"""
+    analyzer = Analyzer()
+    word_frequencies_dict = analyzer.analyze_all(documents)
+    unique_words = sorted(analyzer.vocabulary)
+    word_frequencies = analyzer.document_frequency
+    statistics = analyzer.statistics
+    idf = statistics.idf()
 
-combined_text = f"{d_1_unique} {d_2_unique} {d_3_unique}" # Add more documents here as needed!
-unique_words = get_unique_words(combined_text)
-word_frequencies = {word: combined_text.count(word) for word in unique_words}
+    log_freq = []
 
-log_freq = []
+    for i, (word, frequency) in enumerate(sorted(word_frequencies.items()), start=1):
+        log_frequency = round(float(idf[statistics.vocabulary[word]]), 3)
+        log_freq.append(log_frequency)
+        print(f"{i}. {word}\nFrequency: {frequency}\nLog frequency: {log_frequency}\n")
 
-for i, (word, frequency) in enumerate(sorted(word_frequencies.items()), start=1):
-    log_frequency = round(math.log10(3 / frequency), 3)
-    log_freq.append(log_frequency)
-    print(f"{i}. {word}\nFrequency: {frequency}\nLog frequency: {log_frequency}\n")
+    word_frequencies_query = calculate_word_frequencies(query)
 
-word_frequencies_d1 = calculate_word_frequencies(d_1)
-word_frequencies_d2 = calculate_word_frequencies(d_2)
-word_frequencies_d3 = calculate_word_frequencies(d_3)
-word_frequencies_query = calculate_word_frequencies(query)
-# Add more documents here as needed!
+    term_matrix = build_term_matrix(word_frequencies_dict, analyzer.sorted_vocabulary())
 
-word_frequencies_dict = {
-    "d_1_unique": word_frequencies_d1,
-    "d_2_unique": word_frequencies_d2,
-    "d_3_unique": word_frequencies_d3,
-    "query_unique": word_frequencies_query,
-    # Add more documents here as needed!
-}
+    """Only the non-zero counts are stored, in a sparse document-term matrix. For a small corpus like this one it can be exported to a DataFrame with `to_dataframe()`."""
 
-df = create_word_frequencies_df(unique_words, word_frequencies_dict)
+    print(term_matrix.to_dataframe())
 
-df
+    """$$d_{ij} = tf_{ij} \cdot idf_{j} $$"""
 
-"""$$d_{ij} = tf_{ij} \cdot idf_{j} $$"""
+    term_matrix = term_matrix.weighted(log_freq)
+    df = term_matrix.to_dataframe()
 
-for i in range(len(unique_words)):
+    print(df)
 
-  column_name = unique_words[i]
-  constant = log_freq[i]
+    """### Inverted Index
 
-  if column_name in df.columns:
-      df[column_name] = df[column_name] * constant
+    In information retrieval and text/document similarity, an inverted index is a data structure that allows for the quick and efficient retrieval of documents that contain specific words or terms. Every word points to its postings list, the documents containing it together with the word's weight in that document.
+    """
 
-df
+    index = InvertedIndex(term_matrix, idf=log_freq)
 
-"""### Inverted Index
+    for word in unique_words:
+        doc_rows, weights = index.postings(word)
+        postings = [(index.doc_ids[row], round(weight, 3)) for row, weight in zip(doc_rows.tolist(), weights.tolist())]
+        print(f"{word}: {postings}")
 
-In information retrieval and text/document similarity, an inverted index is a data structure that allows for the quick and efficient retrieval of documents that contain specific words or terms.
-"""
+    """## Calculating Inner Product
 
-df.T
+    $$ SC(Q, D_{i}) =  \sum_{j=1}^{n} w_{qj} \cdot d_{ij}$$
 
-"""## Calculating Inner Product
+    <br>
 
-$$ SC(Q, D_{i}) =  \sum_{j=1}^{n} w_{qj} \cdot d_{ij}$$
+    Formula used to calculate the similarity (or score) between a query and a document. Here's what each part of the formula represents:
 
-<br>
+    - $SC(Q, D_i)$: This represents the similarity score (or similarity coefficient) between a query denoted as "$Q$" and a document denoted as "$D_i$."
 
-Formula used to calculate the similarity (or score) between a query and a document. Here's what each part of the formula represents:
+    - $\sum$: The summation symbol, indicating that we are summing the results of the products of the terms within the summation.
 
-- $SC(Q, D_i)$: This represents the similarity score (or similarity coefficient) between a query denoted as "$Q$" and a document denoted as "$D_i$."
+    - $j=1$ and $n$: These specify the range of values for the index variable "j." The summation is performed for all "$j$" values from 1 to "$n$".
 
-- $\sum$: The summation symbol, indicating that we are summing the results of the products of the terms within the summation.
+    - $w_{qj}$: This represents the weight of the term (or word) "$j$" in the query "$Q$".
 
-- $j=1$ and $n$: These specify the range of values for the index variable "j." The summation is performed for all "$j$" values from 1 to "$n$".
+    - $d_{ij}$: This represents the weight of the term "$j$" in the document "$D_i$."
 
-- $w_{qj}$: This represents the weight of the term (or word) "$j$" in the query "$Q$".
+    <br>
 
-- $d_{ij}$: This represents the weight of the term "$j$" in the document "$D_i$."
+    Essentially, the formula computes the similarity score between a query and a document by summing the products of the weights of corresponding terms in both the query and the document. This is often used in information retrieval and text search to rank documents based on their relevance to a given query. The higher the similarity score, the more relevant the document is considered to be to the query.
 
-<br>
+    The query is weighted with the same idf values and scored term at a time: only the postings lists of the query words are visited, and each posting adds $w_{qj} \cdot d_{ij}$ to the score of its document.
+    """
 
-Essentially, the formula computes the similarity score between a query and a document by summing the products of the weights of corresponding terms in both the query and the document. This is often used in information retrieval and text search to rank documents based on their relevance to a given query. The higher the similarity score, the more relevant the document is considered to be to the query.
-"""
+    query_weights = index.weigh_query(word_frequencies_query)
+    scores = index.score(query_weights)
 
-last_row = df.iloc[-1, :]
-dot_products = []
+    dot_product_series = pd.Series([round(scores.get(doc_id, 0.0), 3) for doc_id in index.doc_ids])
 
-for i, row in df.iterrows():
-    if i != df.index[-1]:
-        dot_product = sum(last_row * row)
-        dot_products.append(round(dot_product, 3))
+    print(dot_product_series)
 
-dot_product_series = pd.Series(dot_products)
+    """As we can see from the dot product, **document 2 is giving the best result for our query with  0.486 value.**
 
-dot_product_series
+    For search we usually only need the best few documents. `search` returns the top-k directly, using each word's maximum weight as an upper bound to skip documents that cannot reach the top-k (MaxScore). `exhaustive=True` scores every matching document and gives the same ranking.
+    """
 
-"""As we can see from the dot product, **document 2 is giving the best result for our query with  0.486 value.**
+    print(index.search(query_weights, k=2))
 
-<h1>Contact Me</h1>
-<p>If you have something to say to me please contact me:</p>
+    print(index.search(query_weights, k=2, exhaustive=True))
+
+    """Many queries can be scored at once. `search_batch` weights them with the same vocabulary and idf values, builds one sparse query-term matrix and multiplies it with the document postings, returning the top-k documents of every query."""
+
+    queries = [query, "shipment of gold", "silver delivery"]
+
+    print(index.search_batch([calculate_word_frequencies(q) for q in queries], k=2))
+
+    """### Adding, Updating and Deleting Documents
+
+    The index above is static, so a new document means building it again. A `SegmentedIndex` accepts changes instead: new documents go to a small in-memory segment, deletes leave a tombstone, and segments are merged in the background. $N$ and the word frequencies always describe the live documents, so the scores stay correct.
+    """
+
+    live_index = SegmentedIndex()
+    live_index.add_documents(documents.items())
+    live_index.add_documents([("d_4_unique", "delivery of gold in a silver truck")])
+    live_index.delete_document("d_1_unique")
+
+    print(live_index.search(live_index.weigh_query(word_frequencies_query), k=2))
+
+    """<h1>Contact Me</h1>
+    <p>If you have something to say to me please contact me:</p>
+
+    <ul>
+      <li>Twitter: <a href="https://twitter.com/Doguilmak">Doguilmak</a></li>
+      <li>Mail address: doguilmak@gmail.com</li>
+    </ul>
+    """
+
+    from datetime import datetime
+    print(f"Changes have been made to the project on {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
 
-<ul>
-  <li>Twitter: <a href="https://twitter.com/Doguilmak">Doguilmak</a></li>
-  <li>Mail address: doguilmak@gmail.com</li>
-</ul>
-"""
 
-from datetime import datetime
-print(f"Changes have been made to the project on {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
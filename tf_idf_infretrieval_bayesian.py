@@ -82,220 +82,188 @@ query = "gold silver truck"
 ## **Importing Libraries**
 """
 
-from sklearn.feature_extraction.text import TfidfVectorizer
-import math
-import pandas as pd
+from tf_idf import FeedbackSession, bayesian_weights, build_index, relevance_statistics, tokenize
 
 """## **Building Unique Words List Using TF-IDF Vectorization**
 
 The **TfidfVectorizer** is a component of the scikit-learn library used for text analysis and natural language processing. *TF-IDF* stands for *Term Frequency-Inverse Document Frequency* which is a numerical statistic that reflects the importance of a word within a document relative to a collection of documents (corpus).
 
+Words are extracted the same way the TfidfVectorizer does by default: the text is lowercased and every run of two or more word characters is a word.
+
 ### Creating Funtions for DRY
 """
 
 def get_unique_words(sentence):
-    sentence = sentence.lower()
-    vectorizer = TfidfVectorizer()
-    tfidf_matrix = vectorizer.fit_transform([sentence])
-    unique_words = vectorizer.get_feature_names_out()
-    return unique_words
+    return sorted(set(tokenize(sentence)))
 
-def combine_calculations(query_unique, doc_list, N_doc, R_doc, doc_indices_to_search=None):
-    result_dict = {}
+def combine_calculations(query_unique, index, doc_indices_to_search=()):
+    import pandas as pd
 
-    for idx, document in enumerate(doc_list):
-        for value in query_unique:
-            if value not in result_dict:
-                result_dict[value] = [0] * len(doc_list)
-            if value in document:
-                result_dict[value][idx] += 1
+    statistics = relevance_statistics(index, query_unique, doc_indices_to_search)
+    rows = {
+        'n-document': statistics['n'],
+        'N': [statistics['N']] * len(query_unique),
+        'r-relation': statistics['r'],
+        'R': [statistics['R']] * len(query_unique),
+    }
+    return pd.DataFrame(list(rows.values()), index=list(rows), columns=query_unique)
 
-    df = pd.DataFrame(result_dict, columns=query_unique)
-    summary = df.sum(axis=0).to_frame().T
-    summary.index = ['n-document']
+def calculate_w(r_rel, R, n_doc, N, case):
+    if case not in (1, 2, 3, 4):
+        raise ValueError("Invalid case")
+    return float(bayesian_weights(r_rel, R, n_doc, N)[f"w{case}"])
 
-    df.loc['N'] = N_doc
-    df.loc['R'] = R_doc
-    df = pd.concat([df, summary])
+def main():
+    """Run the example of the notebook."""
+    import pandas as pd
 
-    if doc_indices_to_search is not None:
-        r_relation = [sum(df[col][doc_indices_to_search]) for col in df.columns]
-        df.loc['r-relation'] = r_relation
+    """## **Get Unique Words with TF-IDF**"""
 
-    df = df.loc[['n-document', 'N', 'r-relation', 'R']]
+    d_1 = "shipment of gold damaged in a fire"
+    d_2 = "delivery of silver arrived in a silver truck"
+    d_3 = "shipment of gold arrived in a truck"
+    query = "gold silver truck"
+    # Add more documents here as needed!
 
-    return df
+    d_1_unique = get_unique_words(d_1)
+    d_2_unique = get_unique_words(d_2)
+    d_3_unique = get_unique_words(d_3)
+    query_unique = get_unique_words(query)
+    # Add more documents here as needed!
 
-def calculate_w(r_rel, R, n_doc, N, case):
-    if case == 1:
-        numerator = ((r_rel + 0.5) / (R + 1))
-        denominator = ((n_doc + 1) / (N + 2))
-    elif case == 2:
-        numerator = ((r_rel + 0.5) / (R + 1))
-        denominator = ((n_doc - r_rel + 0.5) / (N - R + 1))
-    elif case == 3:
-        numerator = ((r_rel + 0.5) / (R - r_rel + 0.5))
-        denominator = ((n_doc + 1) / (N - n_doc + 1))
-    elif case == 4:
-        numerator = ((r_rel + 0.5) / (R - r_rel + 0.5))
-        denominator = ((n_doc - r_rel + 0.5) / ((N - n_doc) - (R - r_rel) + 0.5))
-    else:
-        raise ValueError("Invalid case")
+    print(query_unique)
 
-    return round(math.log10(numerator / denominator), 3)
+    print(d_1_unique)
 
-"""## **Get Unique Words with TF-IDF**"""
+    print(d_2_unique)
 
-d_1 = "shipment of gold damaged in a fire"
-d_2 = "delivery of silver arrived in a silver truck"
-d_3 = "shipment of gold arrived in a truck"
-query = "gold silver truck"
-# Add more documents here as needed!
+    print(d_3_unique)
 
-d_1_unique = get_unique_words(d_1)
-d_2_unique = get_unique_words(d_2)
-d_3_unique = get_unique_words(d_3)
-query_unique = get_unique_words(query)
-# Add more documents here as needed!
+    """### **Assumptions**
 
-query_unique
+    The documents are put in an inverted index. $n_{doc}$ is the length of a word's postings list, and $r_{rel}$ is how many of the relevant documents appear in it.
+    """
 
-d_1_unique
+    index = build_index(enumerate([d_1, d_2, d_3])) # Add more documents here as needed!
 
-d_2_unique
+    doc_indices_to_search = [1, 2] # Specify the indices of the documents you want to search.
+                                   # It is starting from 0!
 
-d_3_unique
+    result_df = combine_calculations(query_unique, index, doc_indices_to_search)
+    print(result_df)
 
-"""### **Assumptions**"""
+    """## **Calculating Weights**
 
-doc_list = [
-    d_1_unique,
-    d_2_unique,
-    d_3_unique,
-]
+    In the realm of Bayesian probabilistic retrieval, the process of determining the relevance of documents to a user's query is a multifaceted task, and the calculated weights play a pivotal role in this endeavor. We employ four distinct weight calculation schemes, namely w1, w2, w3, and w4, each tailored to address specific aspects of relevance assessment. These calculations involve intricate considerations, taking into account parameters such as binary relevance, document frequencies, and prior beliefs. For w1 and w2, we scrutinize the term's presence in relevant and non-relevant documents, while w3 and w4 delve into the balance between relevance and non-relevance. The resulting weights serve as a quantitative measure of a document's likelihood to satisfy a user's information needs. By dissecting the complexities of these weight calculations, we gain deeper insights into the nuances of document ranking and retrieval within a Bayesian probabilistic framework.
 
-doc_indices_to_search = [1, 2] # Specify the indices of the documents you want to search.
-                               # It is starting from 0!
+    All four weights are computed for every query word at once with `bayesian_weights`, which works on whole arrays of $r_{rel}$, $R$, $n_{doc}$ and $N$ values (also for many relevance judgments at a time) and rounds to three decimals.
 
-N_doc = 3 # @param {type:"number"}
-R_doc = len(doc_indices_to_search)
+    ### **Calculating W1**
 
-result_df = combine_calculations(query_unique, doc_list, N_doc, R_doc, doc_indices_to_search)
-result_df
+    In the context of Bayesian probabilistic retrieval, $w1$ represents the weight assigned to a term based on the binary relevance ($r_{rel}$) of a document, the total number of relevant documents ($R$), the number of documents containing the term ($n_{doc}$), and the total number of documents in the collection ($N$). The formula calculates the weight by considering the term's relevance in terms of its presence in relevant documents and adjusts it based on the overall document frequency of the term.
 
-"""## **Calculating Weights**
+    <br>
 
-In the realm of Bayesian probabilistic retrieval, the process of determining the relevance of documents to a user's query is a multifaceted task, and the calculated weights play a pivotal role in this endeavor. We employ four distinct weight calculation schemes, namely w1, w2, w3, and w4, each tailored to address specific aspects of relevance assessment. These calculations involve intricate considerations, taking into account parameters such as binary relevance, document frequencies, and prior beliefs. For w1 and w2, we scrutinize the term's presence in relevant and non-relevant documents, while w3 and w4 delve into the balance between relevance and non-relevance. The resulting weights serve as a quantitative measure of a document's likelihood to satisfy a user's information needs. By dissecting the complexities of these weight calculations, we gain deeper insights into the nuances of document ranking and retrieval within a Bayesian probabilistic framework.
+    $$
+    w_1 = \log_{10}\left(\frac{r_{\text{rel}} + 0.5}{R + 1}\right) \cdot \log_{10}\left(\frac{n_{\text{doc}} + 1}{N + 2}\right)
+    $$
+    """
 
-### **Calculating W1**
+    weights = bayesian_weights(result_df.loc['r-relation'].to_numpy(),
+                               result_df.loc['R'].to_numpy(),
+                               result_df.loc['n-document'].to_numpy(),
+                               result_df.loc['N'].to_numpy())
 
-In the context of Bayesian probabilistic retrieval, $w1$ represents the weight assigned to a term based on the binary relevance ($r_{rel}$) of a document, the total number of relevant documents ($R$), the number of documents containing the term ($n_{doc}$), and the total number of documents in the collection ($N$). The formula calculates the weight by considering the term's relevance in terms of its presence in relevant documents and adjusts it based on the overall document frequency of the term.
+    w1 = weights['w1'].tolist()
 
-<br>
+    for column, w_1 in zip(result_df.columns, w1):
+        print(f'{column}: {w_1}')
 
-$$
-w_1 = \log_{10}\left(\frac{r_{\text{rel}} + 0.5}{R + 1}\right) \cdot \log_{10}\left(\frac{n_{\text{doc}} + 1}{N + 2}\right)
-$$
-"""
+    """### **Calculating W2**
 
-w1 = []
+    W2 is another weight in Bayesian probabilistic retrieval, and it takes into account binary relevance, document frequency, and the overall collection statistics. The formula accounts for the presence of the term in both relevant and non-relevant documents ($r_{rel}$ and $n_{doc} - r_{rel}$), and it adjusts the weight based on the number of relevant documents ($R$) and the total collection size ($N$).
 
-for column in result_df.columns:
-    r_rel = result_df.loc['r-relation', column]
-    R = result_df.loc['R', column]
-    n_doc = result_df.loc['n-document', column]
-    N = result_df.loc['N', column]
-    w_1 = calculate_w(r_rel, R, n_doc, N, case=1)
-    w1.append(w_1)
-    print(f'{column}: {w_1}')
+    <br>
 
-"""### **Calculating W2**
+    $$
+    w_2 = \log_{10}\left(\frac{r_{\text{rel}} + 0.5}{R + 1}\right) \cdot \log_{10}\left(\frac{n_{\text{doc}} - r_{\text{rel}} + 0.5}{N - R + 1}\right)
+    $$
+    """
 
-W2 is another weight in Bayesian probabilistic retrieval, and it takes into account binary relevance, document frequency, and the overall collection statistics. The formula accounts for the presence of the term in both relevant and non-relevant documents ($r_{rel}$ and $n_{doc} - r_{rel}$), and it adjusts the weight based on the number of relevant documents ($R$) and the total collection size ($N$).
+    w2 = weights['w2'].tolist()
 
-<br>
+    for column, w_2 in zip(result_df.columns, w2):
+        print(f'{column}: {w_2}')
 
-$$
-w_2 = \log_{10}\left(\frac{r_{\text{rel}} + 0.5}{R + 1}\right) \cdot \log_{10}\left(\frac{n_{\text{doc}} - r_{\text{rel}} + 0.5}{N - R + 1}\right)
-$$
-"""
+    """### **Calculating W3**
 
-w2 = []
+    'w3' introduces a different weighting approach by considering the term's relevance in relation to its non-relevance and adjusting the weight accordingly.
+    This formula is based on the idea that the presence of a term in non-relevant documents ($R - r_{rel}$) may also provide valuable information for ranking documents.
 
-for column in result_df.columns:
-    r_rel = result_df.loc['r-relation', column]
-    R = result_df.loc['R', column]
-    n_doc = result_df.loc['n-document', column]
-    N = result_df.loc['N', column]
-    w_2 = calculate_w(r_rel, R, n_doc, N, case=2)
-    w2.append(w_2)
-    print(f'{column}: {w_2}')
+    <br>
 
-"""### **Calculating W3**
+    $$
+    w_3 = \log_{10}\left(\frac{r_{\text{rel}} + 0.5}{R - r_{\text{rel}} + 0.5}\right) \cdot \log_{10}\left(\frac{n_{\text{doc}} + 1}{N - n_{\text{doc}} + 1}\right)
+    $$
+    """
 
-'w3' introduces a different weighting approach by considering the term's relevance in relation to its non-relevance and adjusting the weight accordingly.
-This formula is based on the idea that the presence of a term in non-relevant documents ($R - r_{rel}$) may also provide valuable information for ranking documents.
+    w3 = weights['w3'].tolist()
 
-<br>
+    for column, w_3 in zip(result_df.columns, w3):
+        print(f'{column}: {w_3}')
 
-$$
-w_3 = \log_{10}\left(\frac{r_{\text{rel}} + 0.5}{R - r_{\text{rel}} + 0.5}\right) \cdot \log_{10}\left(\frac{n_{\text{doc}} + 1}{N - n_{\text{doc}} + 1}\right)
-$$
-"""
+    """### **Calculating W4**
 
-w3 = []
+    'w4' further refines the weighting strategy by considering both relevant and non-relevant documents while taking into account the term's presence in the collection. It balances the relevance and non-relevance of the term in documents, ensuring that it captures the subtleties in the document-term relationship.
 
-for column in result_df.columns:
-    r_rel = result_df.loc['r-relation', column]
-    R = result_df.loc['R', column]
-    n_doc = result_df.loc['n-document', column]
-    N = result_df.loc['N', column]
-    w_3 = calculate_w(r_rel, R, n_doc, N, case=3)
-    w3.append(w_3)
-    print(f'{column}: {w_3}')
+    <br>
 
-"""### **Calculating W4**
+    $$
+    w_4 = \log_{10}\left(\frac{r_{\text{rel}} + 0.5}{R - r_{\text{rel}} + 0.5}\right) \cdot \log_{10}\left(\frac{n_{\text{doc}} - r_{\text{rel}} + 0.5}{(N - n_{\text{doc}}) - (R - r_{\text{rel}}) + 0.5}\right)
+    $$
+    """
 
-'w4' further refines the weighting strategy by considering both relevant and non-relevant documents while taking into account the term's presence in the collection. It balances the relevance and non-relevance of the term in documents, ensuring that it captures the subtleties in the document-term relationship.
+    w4 = weights['w4'].tolist()
 
-<br>
+    for column, w_4 in zip(result_df.columns, w4):
+        print(f'{column}: {w_4}')
 
-$$
-w_4 = \log_{10}\left(\frac{r_{\text{rel}} + 0.5}{R - r_{\text{rel}} + 0.5}\right) \cdot \log_{10}\left(\frac{n_{\text{doc}} - r_{\text{rel}} + 0.5}{(N - n_{\text{doc}}) - (R - r_{\text{rel}}) + 0.5}\right)
-$$
-"""
+    data = {
+        'w1': w1,
+        'w2': w2,
+        'w3': w3,
+        'w4': w4,
+    }
 
-w4 = []
+    df = pd.DataFrame(data, index=query_unique)
+    print(df)
 
-for column in result_df.columns:
-    r_rel = result_df.loc['r-relation', column]
-    R = result_df.loc['R', column]
-    n_doc = result_df.loc['n-document', column]
-    N = result_df.loc['N', column]
-    w_4 = calculate_w(r_rel, R, n_doc, N, case=4)
-    w4.append(w_4)
-    print(f'{column}: {w_4}')
+    """These 'w' values play a crucial role in Bayesian probabilistic retrieval, helping to determine the relevance and ranking of documents within an information retrieval system. They provide a sophisticated framework for document ranking by considering both term presence and relevance information.
 
-data = {
-    'w1': w1,
-    'w2': w2,
-    'w3': w3,
-    'w4': w4,
-}
+    ## **Relevance Feedback**
 
-df = pd.DataFrame(data, index=query_unique)
-df
+    A feedback session uses the weights to rank the documents: a document's score is the sum of the weights of the query words it contains. After each ranking the user judges some documents, $r_{rel}$ and $R$ are updated from the newly judged documents only, and the documents are ranked again.
+    """
 
-"""These 'w' values play a crucial role in Bayesian probabilistic retrieval, helping to determine the relevance and ranking of documents within an information retrieval system. They provide a sophisticated framework for document ranking by considering both term presence and relevance information.
+    session = FeedbackSession(index, query_unique, weight='w4')
+    print(session.rank(k=3))
 
-<h1>Contact Me</h1>
-<p>If you have something to say to me please contact me:</p>
+    session.judge(relevant=doc_indices_to_search)
+    print(session.rank(k=3))
+
+    """
+    <h1>Contact Me</h1>
+    <p>If you have something to say to me please contact me:</p>
+
+    <ul>
+      <li>Twitter: <a href="https://twitter.com/Doguilmak">Doguilmak</a></li>
+      <li>Mail address: doguilmak@gmail.com</li>
+    </ul>
+    """
+
+    from datetime import datetime
+    print(f"Changes have been made to the project on {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
 
-<ul>
-  <li>Twitter: <a href="https://twitter.com/Doguilmak">Doguilmak</a></li>
-  <li>Mail address: doguilmak@gmail.com</li>
-</ul>
-"""
 
-from datetime import datetime
-print(f"Changes have been made to the project on {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
\ No newline at end of file
+if __name__ == "__main__":
+    main()